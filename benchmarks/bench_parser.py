@@ -0,0 +1,94 @@
+"""
+Микро-бенчмарк разбора страниц расписания.
+
+Сравнивает старый разбор (BeautifulSoup по всей странице, .text.strip()
+каждой ячейки) с быстрым (регулярки только по <table>, фильтр по колонке группы).
+
+Запуск:
+    python benchmarks/bench_parser.py                       # синтетические страницы (fixtures.py)
+    python benchmarks/bench_parser.py saved/*.html          # сохранённые страницы сайта
+    python benchmarks/bench_parser.py saved/*.html --group 301 --repeat 50
+"""
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fixtures
+
+fixtures.prepare_bot_env()
+import main
+from bs4 import BeautifulSoup
+
+def legacy_parse(html, group_name):
+    """Разбор в том виде, как он был до быстрого пути"""
+    soup = BeautifulSoup(html, 'html.parser')
+    table = soup.find('table')
+    items = []
+    for row in table.find_all('tr')[1:]:
+        cells = row.find_all('td')
+        if len(cells) >= 7:
+            date = cells[0].text.strip()
+            group = cells[1].text.strip()
+            lesson_num = cells[2].text.strip()
+            subject = cells[3].text.strip()
+            teacher = cells[4].text.strip()
+            room = cells[5].text.strip()
+            if group_name is None or group == group_name:
+                items.append({'date': date, 'group': group, 'lesson_num': lesson_num,
+                              'subject': subject, 'teacher': teacher, 'room': room})
+    soup.find('a', title='Вперед')
+    return items
+
+def fast_parse(html, group_name):
+    main.parse_page_count(html)
+    table_html = main.extract_table_html(html)
+    return main.parse_schedule_table(table_html, group_name)
+
+def soup_parse(html, group_name):
+    main.parse_page_count(html)
+    table_html = main.extract_table_html(html)
+    return main.parse_schedule_table_soup(table_html, group_name)
+
+def measure(parser, pages, group_name, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for html in pages:
+            parser(html, group_name)
+    return (time.perf_counter() - started) / (repeat * len(pages))
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('pages', nargs='*', help='сохранённые HTML-страницы таблицы')
+    parser.add_argument('--group', default=None, help='фильтр по группе (по умолчанию все строки)')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    if args.pages:
+        pages = []
+        for path in args.pages:
+            with open(path, encoding='utf-8') as f:
+                pages.append(f.read())
+    else:
+        pages = fixtures.synthetic_pages(5)
+
+    # Оба пути должны давать одно и то же
+    for html in pages:
+        assert legacy_parse(html, args.group) == fast_parse(html, args.group), 'разбор отличается'
+
+    print(f"Страниц: {len(pages)}, повторов: {args.repeat}, группа: {args.group or 'все'}, "
+          f"парсер BeautifulSoup: {main.SOUP_PARSER}")
+    timings = [(name, measure(func, pages, args.group, args.repeat))
+               for name, func in [('старый (вся страница)', legacy_parse),
+                                  ('soup по таблице', soup_parse),
+                                  ('быстрый (регулярки)', fast_parse)]]
+    legacy = timings[0][1]
+    for name, per_page in timings:
+        print(f"  {name:<24} {per_page * 1000:8.3f} мс/стр  x{legacy / per_page:5.1f}")
+
+if __name__ == '__main__':
+    main_cli()
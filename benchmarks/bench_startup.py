@@ -0,0 +1,72 @@
+"""
+Бенчмарк запуска бота: сколько времени занимает import main в новом
+интерпретаторе и какие тяжёлые модули при этом загружаются.
+
+Для сравнения отдельно меряется импорт BeautifulSoup, Flask и APScheduler —
+столько добавлялось бы к запуску, если бы они грузились сразу.
+
+Запуск:
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --repeat 20
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ['bs4', 'lxml', 'flask', 'apscheduler']
+
+# Выполняется в отдельном процессе, печатает JSON с результатом
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+{import_line}
+elapsed = time.perf_counter() - started
+print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+'''
+
+def run_probe(import_line, workdir):
+    code = PROBE.format(import_line=import_line, heavy=HEAVY_MODULES)
+    env = dict(os.environ, BOT_TOKEN='0:benchmark', PYTHONPATH=ROOT)
+    output = subprocess.run(
+        [sys.executable, '-c', code], cwd=workdir, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    # main.py печатает при импорте, результат — последняя строка
+    return json.loads(output.strip().splitlines()[-1])
+
+def measure(import_line, repeat, workdir):
+    runs = [run_probe(import_line, workdir) for _ in range(repeat)]
+    return [run['seconds'] for run in runs], runs[-1]['loaded']
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    # main.py создаёт schedule.db в текущей папке
+    workdir = tempfile.mkdtemp(prefix='btk-bench-')
+
+    # Первый запуск прогревает .pyc и файловый кэш
+    run_probe('import main', workdir)
+
+    probes = [
+        ('import main', 'import main'),
+        ('  + bs4', 'import bs4'),
+        ('  + flask', 'import flask'),
+        ('  + apscheduler', 'from apscheduler.schedulers.background import BackgroundScheduler'),
+    ]
+    print(f"Python {sys.version.split()[0]}, повторов: {args.repeat}")
+    for name, import_line in probes:
+        timings, loaded = measure(import_line, args.repeat, workdir)
+        print(f"  {name:<16} медиана {statistics.median(timings) * 1000:7.1f} мс, "
+              f"мин {min(timings) * 1000:7.1f} мс"
+              + (f"  (загружены: {', '.join(loaded) or 'ничего тяжёлого'})" if import_line == 'import main' else ''))
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,201 @@
+"""
+Бенчмарки всего пути расписания без обращения к сайту колледжа.
+
+Таблицы на 5, 50 и 200 страниц (и записанные с сайта, если указаны)
+отдаются локальной копией сайта (standin_server.py) с заданной задержкой.
+Для каждой таблицы меряются:
+    crawl cold  — обход с пустым кэшем страниц
+    crawl warm  — повторный обход (сайт отвечает 304)
+    parse       — разбор таблиц всех страниц
+    index       — сборка снимка: группы, индекс по датам, хеши
+    filter      — выборка сегодня/завтра/неделя для каждой группы
+    render      — тексты ответов для каждой группы и кнопки
+    hash        — хеши таблиц страниц и групп
+    check       — check_schedule_updates после изменения одной страницы
+
+Запуск:
+    python benchmarks/bench_suite.py
+    python benchmarks/bench_suite.py --sizes 50 --latency 0.3 --repeat 5
+    python benchmarks/bench_suite.py --recorded benchmarks/recorded --json before.json
+"""
+import argparse
+import contextlib
+import hashlib
+import io
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fixtures
+from standin_server import StandinSite
+
+fixtures.prepare_bot_env()
+import main
+
+INITIAL_SNAPSHOT = dict(main.schedule_snapshot)
+
+def quiet():
+    """main.py много печатает; в замеры печать входит, на экран — нет"""
+    return contextlib.redirect_stdout(io.StringIO())
+
+def measure(func, repeat):
+    """Медиана времени func() за repeat запусков и результат последнего"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings), result
+
+def reset_bot_state():
+    main.page_cache.clear()
+    main.site_next_slot.clear()
+    main.schedule_snapshot = dict(INITIAL_SNAPSHOT)
+    main.previous_schedule_hash = None
+    main.previous_page_digests = []
+    main.previous_group_digests = {}
+    main.previous_groups = {}
+    main.render_cache.clear()
+
+def change_one_page(pages):
+    """Та же таблица, но на средней странице заменён предмет в одной строке"""
+    changed = list(pages)
+    middle = len(changed) // 2
+    changed[middle] = changed[middle].replace('<td>Дисциплина', '<td>Замена', 1)
+    return changed
+
+def bench_table(name, pages, site, args):
+    results = {'table': name, 'pages': len(pages)}
+    site.set_pages(pages)
+    reset_bot_state()
+
+    # Обход: с пустым кэшем страниц и повторный, с ответами 304
+    def crawl_cold():
+        main.page_cache.clear()
+        with quiet():
+            return main.fetch_schedule_pages()
+
+    site.reset_counters()
+    results['crawl_cold'], crawled = measure(crawl_cold, args.crawl_repeat)
+    results['crawl_cold_requests'] = site.counters()['requests'] // args.crawl_repeat
+    results['crawl_cold_bytes'] = site.counters()['bytes'] // args.crawl_repeat
+
+    site.reset_counters()
+    with quiet():
+        results['crawl_warm'], _ = measure(main.fetch_schedule_pages, args.crawl_repeat)
+    results['crawl_warm_304'] = site.counters()['not_modified'] // args.crawl_repeat
+
+    # Разбор: только таблицы, как в fetch_page
+    tables = [main.extract_table_html(html) for html in pages]
+    results['parse'], _ = measure(lambda: [main.parse_schedule_table(table) for table in tables], args.repeat)
+
+    # Снимок с индексами групп и дат
+    with quiet():
+        results['index'], snapshot = measure(lambda: main.merge_snapshot(INITIAL_SNAPSHOT, crawled), args.repeat)
+    results['groups'] = len(snapshot['groups'])
+    results['lessons'] = sum(len(items) for items in snapshot['groups'].values())
+
+    # Выборки, которые делают кнопки
+    today = datetime.now().date()
+    tomorrow = today + timedelta(days=1)
+
+    def filter_all():
+        for index in snapshot['days'].values():
+            index['by_date'].get(today)
+            index['by_date'].get(tomorrow)
+            main.lessons_in_range(index, today, today + timedelta(days=7))
+
+    results['filter'], _ = measure(filter_all, args.repeat)
+
+    # Тексты ответов без кэша готовых ответов
+    now = datetime.now()
+
+    def render_all():
+        for group, index in snapshot['days'].items():
+            for period in ('today', 'tomorrow', 'week'):
+                main.render_schedule(index, group, period, now)
+
+    with quiet():
+        results['render'], _ = measure(render_all, args.repeat)
+
+    def hash_all():
+        for table in tables:
+            hashlib.md5(table.encode('utf-8')).hexdigest()
+        return main.get_digest({group: main.get_digest(items) for group, items in snapshot['groups'].items()})
+
+    results['hash'], _ = measure(hash_all, args.repeat)
+
+    # Полная проверка обновлений после правки одной страницы
+    main.NOTIFICATIONS_ENABLED = False
+    reset_bot_state()
+    with quiet():
+        main.check_schedule_updates()
+    site.set_pages(change_one_page(pages))
+    site.reset_counters()
+    with quiet():
+        results['check'], _ = measure(main.check_schedule_updates, 1)
+    results['check_requests'] = site.counters()['requests']
+    results['check_delta'] = len(main.schedule_snapshot['delta'])
+    return results
+
+def format_seconds(seconds):
+    return f"{seconds * 1000:9.2f} мс" if seconds < 10 else f"{seconds:9.2f} с "
+
+def print_results(results):
+    print(f"\n📊 {results['table']}: {results['pages']} страниц, {results['lessons']} занятий, "
+          f"{results['groups']} групп")
+    print(f"  crawl cold  {format_seconds(results['crawl_cold'])}  "
+          f"({results['crawl_cold_requests']} запросов, {results['crawl_cold_bytes'] // 1024} КБ)")
+    print(f"  crawl warm  {format_seconds(results['crawl_warm'])}  ({results['crawl_warm_304']} ответов 304)")
+    for step in ('parse', 'index', 'filter', 'render', 'hash'):
+        print(f"  {step:<10}  {format_seconds(results[step])}")
+    print(f"  check       {format_seconds(results['check'])}  "
+          f"({results['check_requests']} запросов, изменений: {results['check_delta']})")
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='5,50,200', help='размеры синтетических таблиц в страницах')
+    parser.add_argument('--recorded', action='append', default=[], help='папка с записанными страницами')
+    parser.add_argument('--latency', type=float, default=0.05, help='задержка ответа копии сайта, секунд')
+    parser.add_argument('--rps', type=float, default=1000,
+                        help='лимит запросов в секунду (у бота для сайта колледжа — 5)')
+    parser.add_argument('--repeat', type=int, default=20, help='повторов для замеров без сети')
+    parser.add_argument('--crawl-repeat', type=int, default=3, help='повторов для обходов')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', help='сохранить результаты в файл для сравнения до/после')
+    args = parser.parse_args()
+
+    tables = [(path, fixtures.load_pages(path)) for path in args.recorded]
+    for size in filter(None, args.sizes.split(',')):
+        tables.append((f"синтетическая {size}", fixtures.synthetic_pages(int(size), seed=args.seed)))
+
+    main.CRAWL_MAX_RPS = args.rps
+    main.MAX_PAGES = max([main.MAX_PAGES] + [len(pages) + 1 for _, pages in tables])
+
+    site = StandinSite([], latency=args.latency)
+    main.SCHEDULE_URL = site.start()
+    print(f"🌐 Копия сайта {main.SCHEDULE_URL}, задержка {args.latency} с, лимит {args.rps} запр/с, "
+          f"потоков обхода: {main.CRAWL_WORKERS}")
+
+    all_results = []
+    for name, pages in tables:
+        results = bench_table(name, pages, site, args)
+        print_results(results)
+        all_results.append(results)
+    site.stop()
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(all_results, f, ensure_ascii=False, indent=2)
+        print(f"\n💾 Результаты сохранены в {args.json}")
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,143 @@
+"""
+Страницы таблицы «Текущее расписание» для бенчмарков.
+
+Синтетические страницы повторяют вёрстку Joomla-сайта колледжа: шапка,
+меню, таблица на PAGE_SIZE строк, пагинация по limitstart со счётчиком
+«Страница N из M». Даты идут от сегодняшнего дня, чтобы кнопки
+«Сегодня» и «Завтра» находили занятия.
+
+Настоящие страницы можно записать с сайта и потом гонять бенчмарки на них:
+    python benchmarks/fixtures.py record benchmarks/recorded
+    python benchmarks/fixtures.py synthetic 50 benchmarks/synthetic-50
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from urllib.request import Request, urlopen
+
+PAGE_SIZE = 20
+MONTHS = ('', 'янв', 'фев', 'мар', 'апр', 'май', 'июн', 'июл', 'авг', 'сен', 'окт', 'ноя', 'дек')
+SITE_URL = "https://www.bartc.by/index.php/ru/obuchayushchemusya/dnevnoe-otdelenie/tekushchee-raspisanie"
+
+def prepare_bot_env(prefix='btk-bench-'):
+    """
+    Готовит процесс к import main: main.py требует токен и создаёт
+    schedule.db в текущей папке, поэтому ставим токен-заглушку и
+    переходим во временную папку. Возвращает её путь
+    """
+    os.environ.setdefault('BOT_TOKEN', '0:benchmark')
+    workdir = tempfile.mkdtemp(prefix=prefix)
+    os.chdir(workdir)
+    return workdir
+
+def make_groups(count):
+    return [str(100 + i * 7) for i in range(count)]
+
+def synthetic_rows(pages, seed=1, groups=40, days=14, start=None):
+    """Строки таблицы: (дата, группа, пара, дисциплина, преподаватель, аудитория, примечание)"""
+    rnd = random.Random(seed)
+    start = start or date.today()
+    names = make_groups(groups)
+    total = pages * PAGE_SIZE
+    rows = []
+    for i in range(total):
+        day = start + timedelta(days=i * days // total)
+        rows.append((
+            f"{day.day}-{MONTHS[day.month]}",
+            rnd.choice(names),
+            str(rnd.randint(1, 6)),
+            f"Дисциплина {rnd.randint(1, 60)}",
+            f"Преподаватель&nbsp;{rnd.randint(1, 90)}",
+            str(rnd.randint(100, 420)),
+            '',
+        ))
+    return rows
+
+def render_page(rows, page):
+    """HTML страницы page (с нуля) из всех строк таблицы"""
+    offset = page * PAGE_SIZE
+    page_count = max(1, (len(rows) + PAGE_SIZE - 1) // PAGE_SIZE)
+    body = [
+        '<table class="table table-striped"><tr><th>Дата</th><th>Группа</th><th>Пара</th>'
+        '<th>Дисциплина</th><th>Преподаватель</th><th>Аудитория</th><th>Примечание</th></tr>'
+    ]
+    for row in rows[offset:offset + PAGE_SIZE]:
+        body.append('<tr>' + ''.join(f'<td>{cell}</td>' for cell in row) + '</tr>')
+    body.append('</table>')
+
+    links = []
+    if page + 1 < page_count:
+        links.append(f'<li><a title="Вперед" href="?limitstart={offset + PAGE_SIZE}" class="pagenav">Вперед</a></li>')
+        links.append(f'<li><a title="В конец" href="?limitstart={(page_count - 1) * PAGE_SIZE}" class="pagenav">В конец</a></li>')
+    pagination = (
+        f'<div class="pagination"><p class="counter">Страница {page + 1} из {page_count}</p>'
+        f'<ul>{"".join(links)}</ul></div>'
+    )
+    menu = ''.join(f'<li><a href="/index.php/ru/item-{i}">Пункт меню {i}</a></li>' for i in range(150))
+    return (
+        '<!DOCTYPE html><html><head><title>Текущее расписание</title></head><body>'
+        f'<nav><ul>{menu}</ul></nav><div class="item-page">{"".join(body)}{pagination}</div>'
+        '<footer>Барановичский технологический колледж</footer></body></html>'
+    )
+
+def synthetic_pages(pages, seed=1, **kwargs):
+    """Список HTML всех страниц синтетической таблицы"""
+    rows = synthetic_rows(pages, seed=seed, **kwargs)
+    return [render_page(rows, page) for page in range(pages)]
+
+def load_pages(directory):
+    """Страницы, записанные record или save (page-000.html, page-001.html, ...)"""
+    names = sorted(name for name in os.listdir(directory) if re.fullmatch(r'page-\d+\.html', name))
+    pages = []
+    for name in names:
+        with open(os.path.join(directory, name), encoding='utf-8') as f:
+            pages.append(f.read())
+    return pages
+
+def save_pages(pages, directory):
+    os.makedirs(directory, exist_ok=True)
+    for page, html in enumerate(pages):
+        with open(os.path.join(directory, f'page-{page:03d}.html'), 'w', encoding='utf-8') as f:
+            f.write(html)
+
+def record(directory, url=SITE_URL, max_pages=200, delay=1.0):
+    """Скачивает страницы таблицы с сайта, пока не встретится страница без строк"""
+    pages = []
+    for page in range(max_pages):
+        request = Request(f"{url}?limitstart={page * PAGE_SIZE}", headers={'User-Agent': 'Mozilla/5.0'})
+        with urlopen(request, timeout=30) as response:
+            html = response.read().decode('utf-8')
+        if '<td' not in html:
+            break
+        pages.append(html)
+        print(f"📥 Страница {page + 1}: {len(html)} байт")
+        time.sleep(delay)  # Не нагружаем сайт колледжа
+    save_pages(pages, directory)
+    print(f"💾 Записано {len(pages)} страниц в {directory}")
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+    rec = commands.add_parser('record', help='записать страницы с сайта колледжа')
+    rec.add_argument('directory')
+    rec.add_argument('--url', default=SITE_URL)
+    rec.add_argument('--max-pages', type=int, default=200)
+    syn = commands.add_parser('synthetic', help='сохранить синтетическую таблицу')
+    syn.add_argument('pages', type=int)
+    syn.add_argument('directory')
+    syn.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record(args.directory, args.url, args.max_pages)
+    else:
+        save_pages(synthetic_pages(args.pages, seed=args.seed), args.directory)
+        print(f"💾 Сохранено {args.pages} страниц в {args.directory}")
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
@@ -0,0 +1,253 @@
+"""
+Нагрузочный тест: утренний наплыв пользователей через настоящие обработчики бота.
+
+Бот работает в этом же процессе, но Bot API ему отвечает локальный сервер
+(TELEGRAM_API_URL), а сайт колледжа — копия из standin_server.py
+(SCHEDULE_URL). Обновления подаются в bot.process_new_updates пачками,
+как их отдаёт getUpdates, и растянуты на --spike секунд.
+
+По очереди проигрываются нажатия 📅 Сегодня, 📚 Неделя, 📢 Подписка и
+инлайн-кнопки «Подписаться». Для каждого действия печатаются p50/p95/p99
+времени до последнего ответа бота, отказы «очередь занята», запросы к сайту
+и вызовы Bot API на одно действие пользователя.
+
+Запуск:
+    python benchmarks/load_test.py
+    python benchmarks/load_test.py --users 3000 --groups 60 --spike 2 --site-latency 0.3
+"""
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fixtures
+from standin_server import StandinSite
+
+class FakeTelegram:
+    """
+    Bot API на localhost: отвечает как Telegram и отмечает, когда бот
+    закончил отвечать пользователю на текущее действие
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.message_ids = itertools.count(1)
+        self.calls = Counter()
+        self.pending = {}   # chat_id -> время, когда пользователь нажал кнопку
+        self.final = ()     # Методы, которыми заканчивается ответ на действие
+        self.latencies = []
+        self.rejected = 0
+        self.done = threading.Event()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self.make_handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name='fake-telegram', daemon=True).start()
+        return self.url
+
+    def begin_round(self, pressed_at, final_methods):
+        with self.lock:
+            self.pending = dict(pressed_at)
+            self.final = final_methods
+            self.latencies = []
+            self.rejected = 0
+            self.calls = Counter()
+            self.done.clear()
+
+    def record(self, method, params):
+        now = time.perf_counter()
+        chat_id = int(params.get('chat_id', 0) or 0)
+        text = params.get('text', '')
+        with self.lock:
+            self.calls[method] += 1
+            if chat_id not in self.pending or method not in self.final:
+                return
+            if text.startswith('🔍'):
+                return  # Заглушка «Ищу расписание», ответ ещё впереди
+            pressed_at = self.pending.pop(chat_id)
+            if text.startswith('⏳ Сейчас очень много запросов'):
+                self.rejected += 1
+            else:
+                self.latencies.append(now - pressed_at)
+            if not self.pending:
+                self.done.set()
+
+    def make_handler(self):
+        telegram = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                method = url.path.rsplit('/', 1)[-1]
+                params = dict(parse_qsl(url.query))
+                length = int(self.headers.get('Content-Length') or 0)
+                if length:
+                    body = self.rfile.read(length).decode('utf-8')
+                    if body.startswith('{'):
+                        params.update(json.loads(body))
+                    else:
+                        params.update(parse_qsl(body))
+
+                if telegram.latency:
+                    time.sleep(telegram.latency)
+                telegram.record(method, params)
+
+                result = True
+                if method in ('sendMessage', 'editMessageText'):
+                    result = {
+                        'message_id': int(params.get('message_id') or next(telegram.message_ids)),
+                        'date': int(time.time()),
+                        'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+                        'text': params.get('text', ''),
+                    }
+                data = json.dumps({'ok': True, 'result': result}).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST
+
+        return Handler
+
+def make_update(update_id, user_id, text=None, callback_data=None):
+    user = {'id': user_id, 'is_bot': False, 'first_name': f'user{user_id}'}
+    chat = {'id': user_id, 'type': 'private'}
+    message = {'message_id': update_id, 'date': int(time.time()), 'chat': chat, 'from': user}
+    if callback_data is None:
+        return {'update_id': update_id, 'message': dict(message, text=text)}
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id), 'from': user, 'chat_instance': str(user_id),
+            'data': callback_data, 'message': dict(message, text='📢 Управление подпиской'),
+        },
+    }
+
+def percentile(values, share):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(share * len(ordered)))]
+
+# Действие -> (текст или данные кнопки, методы, которыми заканчивается ответ)
+ACTIONS = [
+    ('📅 Сегодня', {'text': '📅 Сегодня'}, ('editMessageText', 'sendMessage')),
+    ('📚 Неделя', {'text': '📚 Неделя'}, ('editMessageText', 'sendMessage')),
+    ('📢 Подписка', {'text': '📢 Подписка'}, ('sendMessage',)),
+    ('✅ Подписаться', {'callback_data': 'subscribe'}, ('editMessageText',)),
+]
+
+def run_round(main, telegram, site, users, action, args, update_ids):
+    name, payload, final_methods = action
+    users = list(users)
+    random.shuffle(users)
+    updates = [make_update(next(update_ids), user_id, **payload) for user_id in users]
+    batches = [updates[i:i + args.batch] for i in range(0, len(updates), args.batch)]
+    interval = args.spike / max(len(batches), 1)
+
+    site.reset_counters()
+    pressed_at = {}
+    telegram.begin_round({user_id: float('inf') for user_id in users}, final_methods)
+    started = time.perf_counter()
+    for i, batch in enumerate(batches):
+        delay = started + i * interval - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        now = time.perf_counter()
+        with telegram.lock:
+            for update in batch:
+                chat_id = (update.get('message') or update['callback_query']['message'])['chat']['id']
+                telegram.pending[chat_id] = now
+                pressed_at[chat_id] = now
+        main.bot.process_new_updates([main.telebot.types.Update.de_json(update) for update in batch])
+
+    finished = telegram.done.wait(args.timeout)
+    with telegram.lock:
+        latencies = list(telegram.latencies)
+        lost = len(telegram.pending)
+        calls = sum(telegram.calls.values())
+        rejected = telegram.rejected
+    return {
+        'action': name,
+        'users': len(users),
+        'answered': len(latencies),
+        'rejected': rejected,
+        'lost': lost if not finished else 0,
+        'p50': percentile(latencies, 0.50),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'max': max(latencies) if latencies else float('nan'),
+        'seconds': time.perf_counter() - started,
+        'site_requests': site.counters()['requests'],
+        'api_calls_per_action': calls / len(users),
+    }
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--groups', type=int, default=40)
+    parser.add_argument('--pages', type=int, default=15, help='размер таблицы на копии сайта')
+    parser.add_argument('--spike', type=float, default=1.0, help='за сколько секунд приходят все нажатия')
+    parser.add_argument('--batch', type=int, default=100, help='обновлений в одном ответе getUpdates')
+    parser.add_argument('--site-latency', type=float, default=0.2)
+    parser.add_argument('--api-latency', type=float, default=0.03, help='задержка ответа Bot API')
+    parser.add_argument('--timeout', type=float, default=120, help='сколько ждать ответы одного раунда')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--verbose', action='store_true', help='не прятать вывод бота')
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    site = StandinSite(fixtures.synthetic_pages(args.pages, seed=args.seed, groups=args.groups),
+                       latency=args.site_latency)
+    telegram = FakeTelegram(latency=args.api_latency)
+    os.environ['SCHEDULE_URL'] = site.start()
+    os.environ['TELEGRAM_API_URL'] = telegram.start()
+    fixtures.prepare_bot_env(prefix='btk-load-')
+
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        import main
+        groups = fixtures.make_groups(args.groups)
+        users = range(1_000_000, 1_000_000 + args.users)
+        for user_id in users:
+            main.set_user_group(user_id, random.choice(groups))
+
+    print(f"👥 {args.users} пользователей в {args.groups} группах, наплыв за {args.spike} с, "
+          f"сайт: {args.pages} стр. по {args.site_latency} с, Bot API: {args.api_latency} с")
+    print(f"{'действие':<16}{'ответов':>8}{'отказ':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}"
+          f"{'сайт':>7}{'API/действие':>14}")
+
+    update_ids = itertools.count(1)
+    for action in ACTIONS:
+        with output:
+            result = run_round(main, telegram, site, users, action, args, update_ids)
+        print(f"{result['action']:<16}{result['answered']:>8}{result['rejected']:>7}"
+              f"{result['p50'] * 1000:>7.0f}мс{result['p95'] * 1000:>7.0f}мс{result['p99'] * 1000:>7.0f}мс"
+              f"{result['max'] * 1000:>7.0f}мс{result['site_requests']:>7}{result['api_calls_per_action']:>14.2f}"
+              + (f"  ⚠️ без ответа: {result['lost']}" if result['lost'] else ''))
+
+if __name__ == '__main__':
+    main_cli()
@@ -0,0 +1,129 @@
+"""
+Локальная копия сайта колледжа для бенчмарков и нагрузочных тестов.
+
+Отдаёт страницы таблицы по ?limitstart=N с заданной задержкой, ставит ETag
+и отвечает 304 на If-None-Match, считает запросы и отданные байты.
+
+Запуск отдельно (бот направляется на неё через SCHEDULE_URL):
+    python benchmarks/standin_server.py --pages 50 --latency 0.2 --port 8081
+    SCHEDULE_URL=http://127.0.0.1:8081/raspisanie python main.py
+"""
+import argparse
+import hashlib
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fixtures
+
+LIMITSTART_RE = re.compile(r'[?&]limitstart=(\d+)')
+
+class StandinSite:
+    """Сервер в фоновом потоке; страницы можно подменять на ходу через set_pages"""
+
+    def __init__(self, pages, latency=0.0, port=0):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes_sent = 0
+        self.set_pages(pages)
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self.make_handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/raspisanie"
+
+    def set_pages(self, pages):
+        """Новые страницы таблицы (как будто на сайте поменяли расписание)"""
+        encoded = [html.encode('utf-8') for html in pages]
+        etags = ['"%s"' % hashlib.md5(data).hexdigest() for data in encoded]
+        with self.lock:
+            self.pages = encoded
+            self.etags = etags
+
+    def reset_counters(self):
+        with self.lock:
+            self.requests = self.not_modified = self.bytes_sent = 0
+
+    def counters(self):
+        with self.lock:
+            return {'requests': self.requests, 'not_modified': self.not_modified, 'bytes': self.bytes_sent}
+
+    def make_handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, как у настоящего сайта
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if site.latency:
+                    time.sleep(site.latency)
+                match = LIMITSTART_RE.search(self.path)
+                page = int(match.group(1)) // fixtures.PAGE_SIZE if match else 0
+
+                with site.lock:
+                    site.requests += 1
+                    if page < len(site.pages):
+                        data, etag = site.pages[page], site.etags[page]
+                    else:
+                        # За концом таблицы Joomla отдаёт пустую таблицу
+                        data, etag = fixtures.render_page([], 0).encode('utf-8'), '"empty"'
+                    if self.headers.get('If-None-Match') == etag:
+                        site.not_modified += 1
+                        data = None
+                    else:
+                        site.bytes_sent += len(data)
+
+                if data is None:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name='standin-site', daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--pages', type=int, default=15, help='размер синтетической таблицы в страницах')
+    parser.add_argument('--recorded', help='папка со страницами, записанными fixtures.py record')
+    parser.add_argument('--latency', type=float, default=0.2, help='задержка ответа, секунд')
+    parser.add_argument('--port', type=int, default=8081)
+    args = parser.parse_args()
+
+    pages = fixtures.load_pages(args.recorded) if args.recorded else fixtures.synthetic_pages(args.pages)
+    site = StandinSite(pages, latency=args.latency, port=args.port)
+    print(f"🌐 Копия сайта: {site.url} ({len(pages)} страниц, задержка {args.latency} с)")
+    try:
+        site.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main_cli()
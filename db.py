@@ -0,0 +1,208 @@
+"""
+Доступ к schedule.db из всех потоков бота: обработчики telebot,
+планировщик, фоновые обходы сайта и Flask.
+
+У каждого потока своё соединение, база работает в режиме WAL с
+synchronous=NORMAL: чтения не ждут записей, а коммит не делает fsync.
+Подписка и отписка уходят в очередь, и фоновый поток пишет всё
+накопившееся одной транзакцией. Группа пользователя пишется сразу
+(write-through): это один короткий запрос, и ошибку должен увидеть
+обработчик, а не фоновый поток.
+"""
+import json
+import os
+import queue
+import sqlite3
+import threading
+import zlib
+from contextlib import contextmanager
+
+DB_PATH = os.getenv('DB_PATH', 'schedule.db')
+WRITE_BATCH_SIZE = 500  # Больше записей в одну транзакцию не кладём
+
+_local = threading.local()
+_write_queue = queue.Queue()
+_writer_lock = threading.Lock()
+_writer = None
+
+# ---------- Соединения ----------
+def get_connection():
+    """Соединение текущего потока, создаётся при первом обращении"""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        # cached_statements — кэш подготовленных запросов на соединение
+        conn = sqlite3.connect(DB_PATH, timeout=30, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+    return conn
+
+@contextmanager
+def transaction():
+    """Транзакция на соединении потока: commit при успехе, rollback при ошибке"""
+    conn = get_connection()
+    with conn:
+        yield conn
+
+def fetchone(query, params=()):
+    return get_connection().execute(query, params).fetchone()
+
+def fetchall(query, params=()):
+    return get_connection().execute(query, params).fetchall()
+
+# ---------- Пакетная запись ----------
+def write(query, params=()):
+    """Ставит запись в очередь фонового писателя и сразу возвращается"""
+    _start_writer()
+    _write_queue.put((query, params))
+
+def flush():
+    """Ждёт, пока фоновый писатель запишет всё из очереди"""
+    if _writer is not None:
+        _write_queue.join()
+
+def _start_writer():
+    global _writer
+    if _writer is not None:
+        return
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_writer_loop, name='db-writer', daemon=True)
+            _writer.start()
+
+def _writer_loop():
+    while True:
+        # Ждём первую запись, потом забираем всё, что успело накопиться
+        batch = [_write_queue.get()]
+        while len(batch) < WRITE_BATCH_SIZE:
+            try:
+                batch.append(_write_queue.get_nowait())
+            except queue.Empty:
+                break
+
+        try:
+            with transaction() as conn:
+                for query, params in batch:
+                    conn.execute(query, params)
+        except Exception as e:
+            print(f"❌ Ошибка пакетной записи в базу: {e}, пишу по одной")
+            _write_one_by_one(batch)
+        finally:
+            for _ in batch:
+                _write_queue.task_done()
+
+def _write_one_by_one(batch):
+    """Одна плохая запись не должна потерять остальные из пачки"""
+    for query, params in batch:
+        try:
+            with transaction() as conn:
+                conn.execute(query, params)
+        except Exception as e:
+            print(f"❌ Ошибка записи в базу: {e} ({query})")
+
+# ---------- Схема ----------
+def init_db():
+    """Создаёт таблицы пользователей, подписчиков, занятий и состояния бота"""
+    with transaction() as conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS users
+                        (user_id INTEGER PRIMARY KEY, group_name TEXT)''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS subscribers
+                        (user_id INTEGER PRIMARY KEY)''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS lessons
+                        (group_name TEXT NOT NULL,
+                         lesson_date DATE,
+                         raw_date TEXT NOT NULL,
+                         lesson_num INTEGER,
+                         subject TEXT,
+                         teacher TEXT,
+                         room TEXT)''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_lessons_group_date ON lessons (group_name, lesson_date)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_lessons_teacher ON lessons (teacher)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_lessons_room ON lessons (room)")
+        conn.execute('''CREATE TABLE IF NOT EXISTS state
+                        (key TEXT PRIMARY KEY,
+                         value BLOB NOT NULL,
+                         updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)''')
+    print(f"💾 База данных {DB_PATH} инициализирована (WAL)")
+
+# ---------- Пользователи ----------
+def load_user_groups():
+    """{user_id: группа} для всех пользователей"""
+    return dict(fetchall("SELECT user_id, group_name FROM users WHERE group_name IS NOT NULL"))
+
+def save_user_group(user_id, group_name):
+    """Пишет группу сразу, в транзакции текущего потока; ошибка поднимается вызывающему"""
+    with transaction() as conn:
+        conn.execute("INSERT OR REPLACE INTO users (user_id, group_name) VALUES (?, ?)", (user_id, group_name))
+
+# ---------- Подписчики ----------
+def load_subscribers():
+    """Множество user_id всех подписчиков"""
+    return {row[0] for row in fetchall("SELECT user_id FROM subscribers")}
+
+def save_subscriber(user_id):
+    write("INSERT OR IGNORE INTO subscribers (user_id) VALUES (?)", (user_id,))
+
+def remove_subscriber(user_id):
+    write("DELETE FROM subscribers WHERE user_id = ?", (user_id,))
+
+# ---------- Занятия ----------
+def replace_lessons(rows):
+    """
+    Заменяет все занятия одним executemany в одной транзакции.
+    rows — кортежи (group_name, lesson_date, raw_date, lesson_num, subject, teacher, room)
+    """
+    with transaction() as conn:
+        conn.execute("DELETE FROM lessons")
+        conn.executemany(
+            "INSERT INTO lessons (group_name, lesson_date, raw_date, lesson_num, subject, teacher, room) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+
+def load_lessons(group_name, date_from=None, date_to=None):
+    """Занятия группы за диапазон дат (включительно), в формате снимка"""
+    query = "SELECT raw_date, lesson_num, subject, teacher, room FROM lessons WHERE group_name = ?"
+    params = [group_name]
+    if date_from:
+        query += " AND lesson_date >= ?"
+        params.append(date_from.isoformat())
+    if date_to:
+        query += " AND lesson_date <= ?"
+        params.append(date_to.isoformat())
+    query += " ORDER BY lesson_date, lesson_num, rowid"
+
+    return [
+        {
+            'date': raw_date,
+            'group': group_name,
+            'lesson_num': str(lesson_num),
+            'subject': subject,
+            'teacher': teacher,
+            'room': room
+        }
+        for raw_date, lesson_num, subject, teacher, room in fetchall(query, params)
+    ]
+
+# ---------- Состояние бота ----------
+def save_state(values):
+    """
+    Сохраняет {ключ: данные} одной транзакцией: после сбоя в базе либо
+    все значения новые, либо все старые. Данные — JSON, сжатый zlib
+    """
+    rows = [
+        (key, zlib.compress(json.dumps(value, ensure_ascii=False).encode('utf-8')))
+        for key, value in values.items()
+    ]
+    with transaction() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO state (key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)",
+            rows
+        )
+
+def load_state(key):
+    """Данные, сохранённые save_state, или None"""
+    row = fetchone("SELECT value FROM state WHERE key = ?", (key,))
+    if row is None:
+        return None
+    return json.loads(zlib.decompress(row[0]).decode('utf-8'))
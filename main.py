@@ -1,50 +1,77 @@
 import os
 import sys
-import subprocess
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import time
-import sqlite3
 import hashlib
 import json
-from threading import Lock
-
-# Сначала устанавливаем библиотеки
-print("🔄 Проверка и установка библиотек...")
-
-packages = ['pytelegrambotapi', 'requests', 'beautifulsoup4', 'python-dotenv', 'flask', 'apscheduler']
-for package in packages:
-    try:
-        __import__(package.replace('-', '_'))
-        print(f"✅ {package} уже установлен")
-    except ImportError:
-        print(f"📦 Устанавливаю {package}...")
-        subprocess.check_call([sys.executable, '-m', 'pip', 'install', package])
-
-# Теперь импортируем все библиотеки
+import re
+import random
+from threading import BoundedSemaphore, Event, Lock
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from html import escape, unescape
+from functools import wraps
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+import importlib.util
+import traceback
+import hmac
+
+# Зависимости ставятся заранее: pip install -r requirements.txt.
+# BeautifulSoup, Flask и APScheduler импортируются при первом использовании,
+# чтобы после перезапуска бот начинал отвечать как можно раньше
 import telebot
 import requests
-from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
-from flask import Flask
 from threading import Thread
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
 
-print("✅ Все библиотеки загружены")
+import db
+import metrics
+
+# lxml заметно быстрее html.parser, но необязателен
+SOUP_PARSER = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
 
 # ---------- Flask сервер для UptimeRobot ----------
-app = Flask(__name__)
+flask_app = None
+flask_app_lock = Lock()
 
-@app.route('/ping')
 def ping():
     return "pong"
 
-@app.route('/')
 def home():
     return "Бот расписания БТК работает!"
 
+def create_app():
+    """Создаёт Flask-приложение со всеми адресами бота"""
+    from flask import Flask
+    
+    application = Flask(__name__)
+    application.add_url_rule('/ping', view_func=ping)
+    application.add_url_rule('/', view_func=home)
+    application.add_url_rule('/webhook/<secret>', view_func=webhook, methods=['POST'])
+    application.add_url_rule('/metrics', view_func=metrics_view)
+    return application
+
+def get_app():
+    """Flask-приложение, создаётся при первом обращении"""
+    global flask_app
+    if flask_app is None:
+        with flask_app_lock:
+            if flask_app is None:
+                flask_app = create_app()
+    return flask_app
+
+def app(environ, start_response):
+    """WSGI-точка входа (gunicorn main:app): Flask импортируется при первом запросе"""
+    return get_app()(environ, start_response)
+
+def metrics_view():
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 def run():
-    app.run(host='0.0.0.0', port=8080)
+    get_app().run(host='0.0.0.0', port=8080, threaded=True)
 
 def keep_alive():
     t = Thread(target=run)
@@ -52,6 +79,33 @@ def keep_alive():
     t.start()
     print("🌐 Flask-сервер запущен на порту 8080")
 
+# ---------- МЕТРИКИ ----------
+# Отдаются на /metrics. По ним видно, где теряется время: на сайте колледжа,
+# в разборе таблицы, в очередях обработчиков или в Telegram
+PARSE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+
+metrics.histogram('btk_crawl_seconds', 'Полный обход таблицы на сайте')
+metrics.counter('btk_crawl_errors_total', 'Обходы, закончившиеся ошибкой')
+metrics.counter('btk_crawl_pages_total', 'Страницы по результату: parsed, same (HTML не изменился), not_modified (304)')
+metrics.histogram('btk_site_request_seconds', 'Один запрос страницы к сайту колледжа')
+metrics.counter('btk_site_bytes_total', 'Скачано байт с сайта колледжа')
+metrics.histogram('btk_page_parse_seconds', 'Разбор таблицы одной страницы', PARSE_BUCKETS)
+metrics.counter('btk_parse_soup_fallback_total', 'Разборы через BeautifulSoup из-за неожиданной разметки')
+metrics.counter('btk_snapshot_reads_total', 'Чтения снимка: fresh, stale (обновление в фоне), wait (ждали сайт), backoff (сайт лежит, не ждали)')
+metrics.counter('btk_render_cache_total', 'Готовые ответы: hit или miss')
+metrics.histogram('btk_handler_seconds', 'Ответ на кнопку или команду, включая ожидание в очереди')
+metrics.counter('btk_slow_lane_rejected_total', 'Запросы расписания, отклонённые из-за полной очереди')
+metrics.counter('btk_broadcast_messages_total', 'Сообщения рассылки: sent или failed')
+metrics.counter('btk_broadcast_429_total', 'Ответы 429 от Telegram во время рассылки')
+metrics.histogram('btk_telegram_send_seconds', 'Один запрос sendMessage во время рассылки')
+metrics.histogram('btk_scheduler_lag_seconds', 'Опоздание запуска задачи планировщика')
+metrics.counter('btk_scheduler_missed_total', 'Пропущенные запуски задач планировщика')
+metrics.gauge('btk_snapshot_version', 'Версия снимка расписания', lambda: schedule_snapshot['version'])
+metrics.gauge('btk_snapshot_age_seconds', 'Сколько секунд назад обновлялся снимок',
+              lambda: time.time() - schedule_snapshot['updated_at'] if schedule_snapshot['version'] else -1)
+metrics.gauge('btk_render_cache_bytes', 'Память под готовые ответы', lambda: render_cache_state['bytes'])
+metrics.gauge('btk_subscribers', 'Подписчики на уведомления', lambda: len(subscribed_users))
+
 # ---------- Загружаем токен ----------
 load_dotenv()
 BOT_TOKEN = os.getenv('BOT_TOKEN')
@@ -61,8 +115,59 @@ if not BOT_TOKEN:
     print("Создай файл .env и добавь строку: BOT_TOKEN=твой_токен")
     sys.exit(1)
 
+# Для тестов можно направить бота на локальный сервер вместо api.telegram.org
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+if TELEGRAM_API_URL:
+    telebot.apihelper.API_URL = TELEGRAM_API_URL.rstrip('/') + "/bot{0}/{1}"
+    print(f"🧪 Bot API: {TELEGRAM_API_URL}")
+
 bot = telebot.TeleBot(BOT_TOKEN)
 
+# ---------- WEBHOOK ----------
+# Если задан WEBHOOK_URL, Telegram сам присылает обновления на Flask-сервер
+# вместо long polling. Путь и заголовок X-Telegram-Bot-Api-Secret-Token
+# защищены секретом, обновление отдаётся пулу потоков бота, а Telegram
+# сразу получает 200
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # Например https://btk-bot.example.com
+# Общий для всех процессов WSGI-сервера: секрет, придуманный при запуске,
+# у каждого воркера был бы свой, и вебхук принимал бы только один из них
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+
+if WEBHOOK_URL and not re.fullmatch(r'[A-Za-z0-9_-]{1,256}', WEBHOOK_SECRET or ''):
+    print("❌ ОШИБКА: Для WEBHOOK_URL нужен WEBHOOK_SECRET в файле .env")
+    print("Добавь строку: WEBHOOK_SECRET=случайная_строка (латиница, цифры, _ и -, до 256 символов)")
+    sys.exit(1)
+
+def webhook(secret):
+    from flask import abort, request
+    
+    if not WEBHOOK_URL:
+        abort(404)
+    # compare_digest принимает str только из ASCII, поэтому сравниваем байты
+    expected = WEBHOOK_SECRET.encode('utf-8')
+    if not hmac.compare_digest(secret.encode('utf-8'), expected):
+        abort(404)
+    header_secret = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+    if not hmac.compare_digest(header_secret.encode('utf-8'), expected):
+        abort(403)
+    
+    try:
+        update = telebot.types.Update.de_json(request.get_data(as_text=True))
+    except (ValueError, KeyError, TypeError) as e:
+        # Повторная доставка того же тела не поможет — отвечаем 400
+        print(f"⚠️ Вебхук: некорректное обновление ({e})")
+        abort(400)
+    if update:
+        bot.process_new_updates([update])
+    return ''
+
+def setup_webhook():
+    """Регистрирует вебхук в Telegram"""
+    url = f"{WEBHOOK_URL.rstrip('/')}/webhook/{WEBHOOK_SECRET}"
+    bot.remove_webhook()
+    bot.set_webhook(url=url, secret_token=WEBHOOK_SECRET, max_connections=40)
+    print(f"🪝 Вебхук установлен: {WEBHOOK_URL.rstrip('/')}/webhook/***")
+
 # ---------- Твой Telegram ID ----------
 YOUR_USER_ID = 1702505914  # ❗ ТВОЙ ID
 
@@ -70,157 +175,384 @@ YOUR_USER_ID = 1702505914  # ❗ ТВОЙ ID
 NOTIFICATIONS_ENABLED = True  # True - уведомления для всех подписчиков
 subscribed_users = set()  # Множество подписчиков
 subscribers_lock = Lock()  # Для безопасной работы с множеством
+user_groups = {}   # user_id -> группа, копия таблицы users
+group_users = {}   # группа -> множество user_id (обратный индекс)
+user_groups_lock = Lock()
 
 # ---------- База данных ----------
-def init_db():
-    conn = sqlite3.connect('schedule.db')
-    c = conn.cursor()
-    c.execute('''CREATE TABLE IF NOT EXISTS users
-                 (user_id INTEGER PRIMARY KEY, group_name TEXT)''')
-    conn.commit()
-    conn.close()
-    print("💾 База данных пользователей инициализирована")
-
-init_db()
+# Соединения, WAL и пакетная запись — в db.py
+db.init_db()
 
 # ---------- РАБОТА С ПОДПИСЧИКАМИ ----------
-def init_subscribers_db():
-    """Создаёт таблицу для подписчиков в базе данных"""
-    try:
-        conn = sqlite3.connect('schedule.db')
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS subscribers
-                     (user_id INTEGER PRIMARY KEY)''')
-        conn.commit()
-        conn.close()
-        print("💾 Таблица подписчиков инициализирована")
-    except Exception as e:
-        print(f"❌ Ошибка при создании таблицы подписчиков: {e}")
-
 def load_subscribers():
     """Загружает подписчиков из базы данных"""
     global subscribed_users
     try:
-        conn = sqlite3.connect('schedule.db')
-        c = conn.cursor()
-        c.execute("SELECT user_id FROM subscribers")
-        rows = c.fetchall()
+        subscribers = db.load_subscribers()
         with subscribers_lock:
-            subscribed_users = set([row[0] for row in rows])
-        conn.close()
+            subscribed_users = subscribers
         print(f"📋 Загружено {len(subscribed_users)} подписчиков")
     except Exception as e:
         print(f"❌ Ошибка загрузки подписчиков: {e}")
 
-def save_subscriber(user_id):
-    """Сохраняет подписчика в базу данных"""
+load_subscribers()
+
+# ---------- ГРУППЫ ПОЛЬЗОВАТЕЛЕЙ ----------
+# Группы всех пользователей держим в памяти: кнопки не ходят в базу,
+# а рассылке и статистике сразу известны пользователи каждой группы
+def load_user_groups():
+    """Загружает группы пользователей из базы данных"""
+    global user_groups, group_users
     try:
-        conn = sqlite3.connect('schedule.db')
-        c = conn.cursor()
-        c.execute("INSERT OR IGNORE INTO subscribers (user_id) VALUES (?)", (user_id,))
-        conn.commit()
-        conn.close()
+        loaded = db.load_user_groups()
+        by_group = {}
+        for user_id, group_name in loaded.items():
+            by_group.setdefault(group_name, set()).add(user_id)
+        with user_groups_lock:
+            user_groups = loaded
+            group_users = by_group
+        print(f"📋 Загружены группы {len(loaded)} пользователей")
     except Exception as e:
-        print(f"❌ Ошибка сохранения подписчика: {e}")
+        print(f"❌ Ошибка загрузки групп пользователей: {e}")
+
+def get_user_group(user_id):
+    with user_groups_lock:
+        return user_groups.get(user_id)
+
+def set_user_group(user_id, group_name):
+    """Сохраняет группу в базу, затем в память. Если база не записала — исключение"""
+    db.save_user_group(user_id, group_name)
+    with user_groups_lock:
+        old_group = user_groups.get(user_id)
+        if old_group is not None:
+            group_users[old_group].discard(user_id)
+            if not group_users[old_group]:
+                del group_users[old_group]
+        user_groups[user_id] = group_name
+        group_users.setdefault(group_name, set()).add(user_id)
+
+def get_group_users(group_name):
+    """Копия множества пользователей группы"""
+    with user_groups_lock:
+        return set(group_users.get(group_name, ()))
+
+load_user_groups()
+
+# ---------- ЗАНЯТИЯ В БАЗЕ ----------
+# Копия последнего снимка: бот отвечает из неё сразу после перезапуска
+# и когда сайт колледжа недоступен
+def save_lessons(days):
+    """
+    Заменяет все занятия в базе одним пакетом в одной транзакции.
+    days — группа -> индекс по датам из build_date_index
+    """
+    rows = []
+    for group_name, index in days.items():
+        for lesson_date, items in index['by_date'].items():
+            for item in items:
+                rows.append((
+                    group_name,
+                    lesson_date.isoformat() if lesson_date else None,
+                    item['date'],
+                    int(item['lesson_num']) if item['lesson_num'].isdigit() else item['lesson_num'],
+                    item['subject'],
+                    item['teacher'],
+                    item['room'],
+                ))
+    
+    try:
+        db.replace_lessons(rows)
+        print(f"💾 В базу записано {len(rows)} занятий")
+    except Exception as e:
+        print(f"❌ Ошибка сохранения занятий: {e}")
 
-def remove_subscriber(user_id):
-    """Удаляет подписчика из базы данных"""
+def load_lessons(group_name, date_from=None, date_to=None):
+    """Занятия группы из базы за диапазон дат (включительно), в формате снимка"""
     try:
-        conn = sqlite3.connect('schedule.db')
-        c = conn.cursor()
-        c.execute("DELETE FROM subscribers WHERE user_id = ?", (user_id,))
-        conn.commit()
-        conn.close()
+        return db.load_lessons(group_name, date_from, date_to)
     except Exception as e:
-        print(f"❌ Ошибка удаления подписчика: {e}")
+        print(f"❌ Ошибка чтения занятий: {e}")
+        return []
 
-# Инициализируем таблицу подписчиков и загружаем их
-init_subscribers_db()
-load_subscribers()
+# ---------- РАССЫЛКА ----------
+# Пул потоков отправляет сообщения параллельно, а токен-бакет держит общий темп
+# ниже лимита Telegram (~30 сообщений в секунду на бота, ~1 в секунду в один чат).
+# На 429 вся рассылка ставится на паузу на retry_after секунд
+BROADCAST_WORKERS = 8        # Сколько сообщений отправляется одновременно
+BROADCAST_RATE = 25          # Сообщений в секунду на всех, с запасом от лимита
+BROADCAST_BURST = 5          # Сколько сообщений можно отправить разом после простоя
+BROADCAST_CHAT_INTERVAL = 1  # Секунд между сообщениями в один чат
+BROADCAST_MAX_ATTEMPTS = 5   # Попыток на одно сообщение
+BROADCAST_PROGRESS_EVERY = 5 # Как часто (в секундах) печатать прогресс
+
+broadcast_lock = Lock()
+broadcast_bucket = {'tokens': BROADCAST_BURST, 'updated': time.monotonic()}
+broadcast_paused_until = 0  # time.monotonic(), до которого Telegram просил подождать
+chat_next_send = {}         # chat_id -> time.monotonic(), раньше которого в чат не пишем
+
+def take_broadcast_token():
+    """Ждёт токен из общего бакета и паузу после 429"""
+    while True:
+        with broadcast_lock:
+            now = time.monotonic()
+            bucket = broadcast_bucket
+            bucket['tokens'] = min(BROADCAST_BURST, bucket['tokens'] + (now - bucket['updated']) * BROADCAST_RATE)
+            bucket['updated'] = now
+            
+            wait = broadcast_paused_until - now
+            if wait <= 0:
+                if bucket['tokens'] >= 1:
+                    bucket['tokens'] -= 1
+                    return
+                wait = (1 - bucket['tokens']) / BROADCAST_RATE
+        time.sleep(wait)
+
+def wait_for_chat_slot(chat_id):
+    """Не чаще одного сообщения в чат за BROADCAST_CHAT_INTERVAL"""
+    with broadcast_lock:
+        now = time.monotonic()
+        slot = max(now, chat_next_send.get(chat_id, 0))
+        chat_next_send[chat_id] = slot + BROADCAST_CHAT_INTERVAL
+    if slot > now:
+        time.sleep(slot - now)
+
+def pause_broadcast(seconds):
+    """Telegram ответил 429: все потоки ждут retry_after"""
+    global broadcast_paused_until
+    with broadcast_lock:
+        broadcast_paused_until = max(broadcast_paused_until, time.monotonic() + seconds)
+
+def send_with_retry(chat_id, text, stats):
+    """
+    Отправляет одно сообщение с учётом лимитов.
+    429 — ждём retry_after, сетевые ошибки и 5xx — повтор с экспоненциальной
+    задержкой и случайным разбросом, остальные ошибки API (бот заблокирован,
+    чат удалён) — сразу отказ
+    """
+    for attempt in range(1, BROADCAST_MAX_ATTEMPTS + 1):
+        wait_for_chat_slot(chat_id)
+        take_broadcast_token()
+        try:
+            with metrics.timer('btk_telegram_send_seconds'):
+                bot.send_message(chat_id, text, parse_mode='HTML')
+            return True
+        except telebot.apihelper.ApiTelegramException as e:
+            if e.error_code == 429:
+                retry_after = (e.result_json or {}).get('parameters', {}).get('retry_after', 1)
+                metrics.inc('btk_broadcast_429_total')
+                with stats['lock']:
+                    stats['throttled'] += 1
+                print(f"⏸️ Telegram просит подождать {retry_after} с")
+                pause_broadcast(retry_after)
+                error = e
+                continue
+            if e.error_code < 500:
+                print(f"❌ Ошибка отправки пользователю {chat_id}: {e.description}")
+                return False
+            error = e
+        except requests.exceptions.RequestException as e:
+            error = e
+        
+        if attempt < BROADCAST_MAX_ATTEMPTS:
+            with stats['lock']:
+                stats['retries'] += 1
+            time.sleep(min(30, 0.5 * 2 ** attempt) * random.uniform(0.5, 1.5))
+    
+    print(f"❌ Ошибка отправки пользователю {chat_id}: {error}")
+    return False
+
+def run_broadcast(outbox):
+    """Отправляет пары (chat_id, текст) пулом потоков и печатает прогресс"""
+    stats = {'lock': Lock(), 'sent': 0, 'failed': 0, 'retries': 0, 'throttled': 0}
+    started = time.monotonic()
+    last_report = started
+    
+    def send(job):
+        ok = send_with_retry(job[0], job[1], stats)
+        metrics.inc('btk_broadcast_messages_total', result='sent' if ok else 'failed')
+        with stats['lock']:
+            stats['sent' if ok else 'failed'] += 1
+    
+    print(f"📨 Рассылка {len(outbox)} сообщений начата")
+    with ThreadPoolExecutor(max_workers=BROADCAST_WORKERS) as executor:
+        futures = [executor.submit(send, job) for job in outbox]
+        for done, future in enumerate(futures, 1):
+            future.result()
+            now = time.monotonic()
+            if now - last_report >= BROADCAST_PROGRESS_EVERY:
+                last_report = now
+                print(f"📨 Рассылка: {done}/{len(outbox)}, {done / (now - started):.1f} сообщ/с")
+    
+    # Время следующей отправки в чат после рассылки уже не нужно
+    with broadcast_lock:
+        now = time.monotonic()
+        for chat_id in [chat_id for chat_id, slot in chat_next_send.items() if slot <= now]:
+            del chat_next_send[chat_id]
+    
+    elapsed = max(time.monotonic() - started, 0.001)
+    print(f"📨 Уведомления: {stats['sent']} отправлено, {stats['failed']} ошибок, "
+          f"{stats['retries']} повторов, {stats['throttled']} раз 429, "
+          f"{stats['sent'] / elapsed:.1f} сообщ/с за {elapsed:.1f} с")
+    return stats
+
+def start_broadcast(outbox):
+    """Запускает рассылку в фоне, не блокируя планировщик и приём сообщений"""
+    thread = Thread(target=run_broadcast, args=(outbox,), name='broadcast', daemon=True)
+    thread.start()
+    return thread
 
 # ---------- ПЛАНИРОВЩИК ДЛЯ ПРОВЕРКИ РАСПИСАНИЯ ----------
 previous_schedule_hash = None
+previous_page_digests = []   # Хеши страниц на момент прошлой проверки
+previous_group_digests = {}  # Хеши групп на момент прошлой проверки
+previous_groups = {}         # Занятия групп на момент прошлой проверки
+
+def get_digest(data):
+    """MD5 от JSON-представления данных"""
+    data_str = json.dumps(data, sort_keys=True, ensure_ascii=False)
+    return hashlib.md5(data_str.encode('utf-8')).hexdigest()
 
-def get_all_groups_schedule():
-    """Получает расписание для нескольких групп, чтобы проверить изменения"""
-    all_schedule = []
-    # Проверяем популярные группы
-    sample_groups = ['213', '301', '483', '105', '212', '295']
+MAX_CHANGES_IN_MESSAGE = 30  # Остальные изменения сворачиваются в «и ещё N»
+
+def diff_group_schedules(old_groups, new_groups, groups):
+    """
+    Сравнивает расписание указанных групп в двух снимках.
+    Возвращает {группа: {дата: [изменения из diff_lessons]}} только для групп с изменениями.
+    Прошедшие дни пропускаются: сайт убирает вчерашние строки, и о них
+    сообщать не нужно
+    """
+    today = datetime.now().date()
+    changes = {}
+    for group in groups:
+        by_date = {}
+        for change in diff_lessons(old_groups.get(group, []), new_groups.get(group, [])):
+            item = change['new'] or change['old']
+            day = parse_site_date(item['date'], today)
+            if day is not None and day < today:
+                continue
+            by_date.setdefault(item['date'], []).append(change)
+        if by_date:
+            changes[group] = by_date
+    return changes
+
+def describe_lesson(item):
+    return (f"{escape(item['lesson_num'])} пара: <b>{escape(item['subject'])}</b>, "
+            f"{escape(item['teacher'])}, каб. {escape(item['room'])}")
+
+def format_group_changes(group_name, by_date):
+    """Текст уведомления с изменёнными занятиями группы по датам"""
+    today = datetime.now().date()
+    lines = [
+        "🔔 <b>ИЗМЕНЕНИЯ В РАСПИСАНИИ!</b>",
+        f"👥 <b>Группа {escape(group_name)}</b>",
+    ]
     
-    for group in sample_groups:
-        try:
-            schedule = get_schedule_from_site(group)
-            all_schedule.extend(schedule)
-            time.sleep(0.5)  # Небольшая задержка, чтобы не нагружать сайт
-        except Exception as e:
-            print(f"❌ Ошибка при проверке группы {group}: {e}")
+    shown = 0
+    total = sum(len(changes) for changes in by_date.values())
+    dates = sorted(by_date, key=lambda raw: (parse_site_date(raw, today) or date.max, raw))
+    for raw_date in dates:
+        if shown >= MAX_CHANGES_IN_MESSAGE:
+            break
+        lines.append(f"\n📅 <b>{escape(raw_date)}</b>")
+        for change in by_date[raw_date]:
+            if shown >= MAX_CHANGES_IN_MESSAGE:
+                break
+            if change['type'] == 'added':
+                lines.append(f"➕ {describe_lesson(change['new'])}")
+            elif change['type'] == 'removed':
+                lines.append(f"➖ <s>{describe_lesson(change['old'])}</s>")
+            else:
+                lines.append(f"✏️ {describe_lesson(change['new'])}")
+                lines.append(f"     было: {describe_lesson(change['old'])}")
+            shown += 1
     
-    return all_schedule
+    if total > shown:
+        lines.append(f"\n… и ещё {total - shown} изменений, нажми 📚 Неделя")
+    lines.append(f"\n🕒 <i>{datetime.now().strftime('%d.%m.%Y %H:%M')}</i>")
+    return "\n".join(lines)
 
-def get_schedule_hash():
-    """Получает хеш текущего расписания для сравнения"""
-    try:
-        all_schedule = get_all_groups_schedule()
-        # Создаем хеш от всего расписания
-        schedule_str = json.dumps(all_schedule, sort_keys=True, ensure_ascii=False)
-        return hashlib.md5(schedule_str.encode('utf-8')).hexdigest()
-    except Exception as e:
-        print(f"❌ Ошибка при создании хеша: {e}")
-        return None
-
-def notify_all_users():
-    """Рассылает уведомления всем подписчикам"""
+def notify_subscribers(changes):
+    """
+    Рассылает подписчикам изменения только их группы.
+    Подписчикам без сохранённой группы уходит общее уведомление
+    """
     with subscribers_lock:
         if not subscribed_users:
             print("📭 Нет подписчиков для уведомления")
             return
-        users_to_notify = list(subscribed_users)
+        subscribers = set(subscribed_users)
     
-    message = (
+    generic_message = (
         "🔔 <b>ОБНОВЛЕНИЕ РАСПИСАНИЯ!</b>\n\n"
         "На сайте колледжа появились изменения.\n"
-        "Нажми 📚 Неделя, чтобы посмотреть обновлённое расписание.\n\n"
+        "Отправь номер своей группы, чтобы получать только её изменения.\n\n"
         f"📅 <i>{datetime.now().strftime('%d.%m.%Y %H:%M')}</i>"
     )
     
-    success = 0
-    failed = 0
+    outbox = []
+    for group in sorted(changes):
+        group_subscribers = get_group_users(group) & subscribers
+        if group_subscribers:
+            message = format_group_changes(group, changes[group])
+            outbox.extend((user_id, message) for user_id in group_subscribers)
     
-    print(f"📨 Отправка уведомлений {len(users_to_notify)} подписчикам...")
+    with user_groups_lock:
+        without_group = [user_id for user_id in subscribers if user_id not in user_groups]
+    outbox.extend((user_id, generic_message) for user_id in without_group)
     
-    for user_id in users_to_notify:
-        try:
-            bot.send_message(user_id, message, parse_mode='HTML')
-            success += 1
-            time.sleep(0.05)
-        except Exception as e:
-            print(f"❌ Ошибка отправки пользователю {user_id}: {e}")
-            failed += 1
+    if not outbox:
+        print("📭 Изменения не касаются групп подписчиков")
+        return
     
-    print(f"📨 Уведомления: {success} отправлено, {failed} ошибок")
+    print(f"📨 Уведомления получат {len(outbox)} из {len(subscribers)} подписчиков")
+    start_broadcast(outbox)
 
 def check_schedule_updates():
-    """Проверяет обновления расписания"""
-    global previous_schedule_hash
+    """Проверяет обновления расписания: один обход сайта на все группы"""
+    global previous_schedule_hash, previous_page_digests, previous_group_digests, previous_groups
     
     print(f"\n{'='*50}")
     print(f"🔄 Проверка обновлений расписания ({datetime.now().strftime('%H:%M')})")
     
     try:
-        current_hash = get_schedule_hash()
+        snapshot = refresh_shared()
         
-        if not current_hash:
-            print("❌ Не удалось получить хеш")
+        if not snapshot:
+            print("❌ Не удалось получить расписание")
             return
         
+        current_hash = snapshot['hash']
+        
         if previous_schedule_hash and current_hash != previous_schedule_hash:
             print("✅ ИЗМЕНЕНИЯ ОБНАРУЖЕНЫ!")
             
-            # Отправляем уведомления всем подписчикам
-            if NOTIFICATIONS_ENABLED:
-                notify_all_users()
+            changed_pages = [
+                i + 1 for i, digest in enumerate(snapshot['page_digests'])
+                if i >= len(previous_page_digests) or previous_page_digests[i] != digest
+            ]
+            group_digests = snapshot['group_digests']
+            changed_groups = sorted(
+                group for group in set(group_digests) | set(previous_group_digests)
+                if group_digests.get(group) != previous_group_digests.get(group)
+            )
+            print(f"📄 Изменённые страницы: {changed_pages}")
+            print(f"👥 Изменённые группы: {changed_groups}")
+            
+            changes = diff_group_schedules(previous_groups, snapshot['groups'], changed_groups)
+            
+            # Каждому подписчику — изменения его группы
+            if not changes:
+                print("📭 Изменения только в прошедших днях, уведомлять не о чем")
+            elif NOTIFICATIONS_ENABLED:
+                notify_subscribers(changes)
         
+        hash_changed = current_hash != previous_schedule_hash
         previous_schedule_hash = current_hash
+        previous_page_digests = snapshot['page_digests']
+        previous_group_digests = snapshot['group_digests']
+        previous_groups = snapshot['groups']
+        if hash_changed:
+            save_notified_state()
         print(f"✅ Текущий хеш: {current_hash[:8]}...")
         
     except Exception as e:
@@ -228,9 +560,27 @@ def check_schedule_updates():
     
     print('='*50)
 
+def record_job_lag(event):
+    """Насколько позже назначенного времени задача ушла в работу"""
+    run_times = getattr(event, 'scheduled_run_times', None)
+    if not run_times:
+        metrics.inc('btk_scheduler_missed_total', job=event.job_id)
+        return
+    for run_time in run_times:
+        lag = (datetime.now(run_time.tzinfo) - run_time).total_seconds()
+        metrics.observe('btk_scheduler_lag_seconds', max(lag, 0), job=event.job_id)
+
 def start_scheduler():
-    """Запускает планировщик проверки расписания"""
+    """Запускает планировщик проверки расписания и фонового обновления снимка"""
+    global background_scheduler
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.triggers.cron import CronTrigger
+    
+    from apscheduler.events import EVENT_JOB_SUBMITTED, EVENT_JOB_MISSED
+    
     scheduler = BackgroundScheduler()
+    background_scheduler = scheduler
+    scheduler.add_listener(record_job_lag, EVENT_JOB_SUBMITTED | EVENT_JOB_MISSED)
     
     # Проверка каждые 20 минут с 9 до 20 часов
     scheduler.add_job(
@@ -248,6 +598,10 @@ def start_scheduler():
     )
     
     scheduler.start()
+    
+    # Снимок для кнопок обновляется сам, с интервалом по времени суток
+    schedule_next_refresh()
+    
     print("⏰ Планировщик проверки расписания запущен")
     print("⏰ Режим работы: каждые 30 минут с 9:00 до 20:00")
     print(f"👥 Уведомления будут приходить всем подписчикам")
@@ -255,289 +609,1313 @@ def start_scheduler():
     return scheduler
 
 # ---------- РАСПИСАНИЕ ЗВОНКОВ ----------
+# Таблицы звонков разбираются один раз при запуске: из них получаются готовые
+# тексты кнопки «Звонки», время пар для расписания и минуты начала и конца
+# каждой пары по дням недели для кнопки «Сейчас»
+DAY_NAMES_RU = ("ПОНЕДЕЛЬНИК", "ВТОРНИК", "СРЕДА", "ЧЕТВЕРГ", "ПЯТНИЦА", "СУББОТА", "ВОСКРЕСЕНЬЕ")
+
+# (номер пары, 1 подгруппа, 2 подгруппа)
+# Расписание для понедельника, среды, пятницы
+BELLS_MON_WED_FRI = [
+    (1, "8.00 – 8.45", "8.55 – 9.40"),
+    (2, "9.50 – 10.35", "11.00 – 11.45"),
+    (3, "12.20 – 13.05", "13.15 – 14.00"),
+    (4, "14.10 – 14.55", "15.05 – 15.50"),
+    (5, "16.00 – 16.45", "16.55 – 17.40"),
+    (6, "17.50 – 18.35", "18.45 – 19.30")
+]
+
+# Расписание для вторника
+BELLS_TUESDAY = [
+    (1, "8.00 – 8.45", "8.55 – 9.40"),
+    (2, "9.50 – 10.35", "11.00 – 11.45"),
+    (3, "12.20 – 13.05", "13.15 – 14.00"),
+    (4, "15.05 – 15.50", "16.00 – 16.45"),
+    (5, "16.55 – 17.40", "17.50 – 18.35"),
+    (6, "18.45 – 19.30", "19.40 – 20.25")
+]
+
+# Расписание для четверга
+BELLS_THURSDAY = [
+    (1, "8.00 – 8.45", "8.55 – 9.40"),
+    (2, "9.50 – 10.35", "11.00 – 11.45"),
+    (3, "12.20 – 13.05", "13.15 – 14.00"),
+    (4, "14.45 – 15.30", "15.40 – 16.25"),
+    (5, "16.35 – 17.20", "17.30 – 18.15"),
+    (6, "18.25 – 19.10", "19.20 – 20.05")
+]
+
+# Расписание для субботы
+BELLS_SATURDAY = [
+    (1, "8.00 – 8.45", "8.55 – 9.40"),
+    (2, "9.50 – 10.35", "10.45 – 11.30"),
+    (3, "11.50 – 12.35", "12.40 – 13.25"),
+    (4, "13.35 – 14.20", "14.30 – 15.15"),
+    (5, "15.25 – 16.10", "16.20 – 17.05")
+]
+
+# День недели -> (звонки, дополнительная строка); в воскресенье занятий нет
+BELL_TABLES = {
+    0: (BELLS_MON_WED_FRI, ""),
+    1: (BELLS_TUESDAY, "\n⏰ <b>Классный час:</b> 14.10 – 14.55\n"),
+    2: (BELLS_MON_WED_FRI, ""),
+    3: (BELLS_THURSDAY, "\n⏰ <b>Часы информации:</b> 14.10 – 14.35\n"),
+    4: (BELLS_MON_WED_FRI, ""),
+    5: (BELLS_SATURDAY, ""),
+}
+
+def parse_clock(text):
+    """«8.55» -> минуты от полуночи"""
+    hours, minutes = text.strip().split('.')
+    return int(hours) * 60 + int(minutes)
+
+def format_clock(minutes):
+    """Минуты от полуночи -> «8.55»"""
+    return f"{minutes // 60}.{minutes % 60:02d}"
+
+def build_timetable(bells):
+    """
+    Разбирает звонки одного дня. Возвращает {'starts': начала пар,
+    'pairs': [(номер, начало, конец, [(начало, конец) по подгруппам])]}
+    в минутах от полуночи, по порядку
+    """
+    pairs = []
+    for num, *halves in bells:
+        spans = [tuple(parse_clock(part) for part in half.split('–')) for half in halves]
+        pairs.append((num, spans[0][0], spans[-1][1], spans))
+    return {'starts': [pair[1] for pair in pairs], 'pairs': pairs}
+
+def render_bell_schedule(day_of_week):
+    """Текст расписания звонков для дня недели 0-6"""
+    if day_of_week not in BELL_TABLES:  # ВС - нет занятий
+        return "🎉 Воскресенье - выходной день!"
+    
+    bells, special = BELL_TABLES[day_of_week]
+    parts = [
+        f"🔔 <b>РАСПИСАНИЕ ЗВОНКОВ</b>\n📅 <b>{DAY_NAMES_RU[day_of_week]}</b>\n",
+        "══════════════════════\n\n",
+    ]
+    for num, first, second in bells:
+        parts.append(f"<b>{num} пара:</b>\n")
+        parts.append(f"  ⏱️ <b>{first}</b> (1 подгруппа)\n")
+        parts.append(f"  ⏱️ <b>{second}</b> (2 подгруппа)\n\n")
+    parts.append(special)
+    parts.append("══════════════════════")
+    return "".join(parts)
+
+TIMETABLE = {day: build_timetable(bells) for day, (bells, _) in BELL_TABLES.items()}
+LESSON_TIMES = {
+    day: {num: f"{format_clock(start)} – {format_clock(end)}" for num, start, end, _ in timetable['pairs']}
+    for day, timetable in TIMETABLE.items()
+}
+BELL_TEXTS = [render_bell_schedule(day) for day in range(7)]
+
 def get_bell_schedule(day_of_week):
     """
     Возвращает расписание звонков для указанного дня недели
     day_of_week: 0-6 (понедельник-воскресенье)
     """
-    days = {
-        0: "ПОНЕДЕЛЬНИК",
-        1: "ВТОРНИК",
-        2: "СРЕДА",
-        3: "ЧЕТВЕРГ",
-        4: "ПЯТНИЦА",
-        5: "СУББОТА",
-        6: "ВОСКРЕСЕНЬЕ"
-    }
-
-    day_name = days.get(day_of_week, "")
-
-    # Расписание для понедельника, среды, пятницы
-    mon_wed_fri = [
-        ("1 пара", "8.00 – 8.45", "8.55 – 9.40"),
-        ("2 пара", "9.50 – 10.35", "11.00 – 11.45"),
-        ("3 пара", "12.20 – 13.05", "13.15 – 14.00"),
-        ("4 пара", "14.10 – 14.55", "15.05 – 15.50"),
-        ("5 пара", "16.00 – 16.45", "16.55 – 17.40"),
-        ("6 пара", "17.50 – 18.35", "18.45 – 19.30")
-    ]
-
-    # Расписание для вторника
-    tuesday = [
-        ("1 пара", "8.00 – 8.45", "8.55 – 9.40"),
-        ("2 пара", "9.50 – 10.35", "11.00 – 11.45"),
-        ("3 пара", "12.20 – 13.05", "13.15 – 14.00"),
-        ("4 пара", "15.05 – 15.50", "16.00 – 16.45"),
-        ("5 пара", "16.55 – 17.40", "17.50 – 18.35"),
-        ("6 пара", "18.45 – 19.30", "19.40 – 20.25")
-    ]
+    return BELL_TEXTS[day_of_week]
 
-    # Расписание для четверга
-    thursday = [
-        ("1 пара", "8.00 – 8.45", "8.55 – 9.40"),
-        ("2 пара", "9.50 – 10.35", "11.00 – 11.45"),
-        ("3 пара", "12.20 – 13.05", "13.15 – 14.00"),
-        ("4 пара", "14.45 – 15.30", "15.40 – 16.25"),
-        ("5 пара", "16.35 – 17.20", "17.30 – 18.15"),
-        ("6 пара", "18.25 – 19.10", "19.20 – 20.05")
-    ]
-
-    # Расписание для субботы
-    saturday = [
-        ("1 пара", "8.00 – 8.45", "8.55 – 9.40"),
-        ("2 пара", "9.50 – 10.35", "10.45 – 11.30"),
-        ("3 пара", "11.50 – 12.35", "12.40 – 13.25"),
-        ("4 пара", "13.35 – 14.20", "14.30 – 15.15"),
-        ("5 пара", "15.25 – 16.10", "16.20 – 17.05")
-    ]
-
-    if day_of_week in [0, 2, 4]:  # ПН, СР, ПТ
-        schedule = mon_wed_fri
-        special = ""
-    elif day_of_week == 1:  # ВТ
-        schedule = tuesday
-        special = "\n⏰ <b>Классный час:</b> 14.10 – 14.55\n"
-    elif day_of_week == 3:  # ЧТ
-        schedule = thursday
-        special = "\n⏰ <b>Часы информации:</b> 14.10 – 14.35\n"
-    elif day_of_week == 5:  # СБ
-        schedule = saturday
-        special = ""
-    else:  # ВС - нет занятий
-        return "🎉 Воскресенье - выходной день!"
+def find_pairs(day_of_week, minute):
+    """
+    Пары дня по звонкам относительно минуты minute от полуночи.
+    Возвращает (идущая пара или None, список следующих пар)
+    """
+    timetable = TIMETABLE.get(day_of_week)
+    if not timetable:
+        return None, []
+    
+    i = bisect_right(timetable['starts'], minute)
+    pairs = timetable['pairs']
+    current = pairs[i - 1] if i and minute < pairs[i - 1][2] else None
+    return current, pairs[i:]
 
-    # Форматируем расписание
-    text = f"🔔 <b>РАСПИСАНИЕ ЗВОНКОВ</b>\n📅 <b>{day_name}</b>\n"
-    text += "══════════════════════\n\n"
+# ---------- Парсинг расписания занятий (ВСЕ СТРАНИЦЫ) ----------
+# Через SCHEDULE_URL бота можно направить на локальную копию сайта (benchmarks/standin_server.py)
+SCHEDULE_URL = os.getenv(
+    'SCHEDULE_URL',
+    "https://www.bartc.by/index.php/ru/obuchayushchemusya/dnevnoe-otdelenie/tekushchee-raspisanie"
+)
+SCHEDULE_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'ru-RU,ru;q=0.8,en-US;q=0.5,en;q=0.3',
+}
+PAGE_SIZE = 20          # Сколько записей на странице
+MAX_PAGES = 100         # Предохранитель на случай, если пагинация сломается
+CRAWL_WORKERS = 4       # Сколько страниц качаем одновременно
+CRAWL_MAX_RPS = 5       # Не больше стольких запросов в секунду к одному сайту
+
+def create_http_session():
+    """Сессия с пулом keep-alive соединений и повторами при сбоях сайта"""
+    session = requests.Session()
+    session.headers.update(SCHEDULE_HEADERS)
+    retry = Retry(
+        total=3,
+        backoff_factor=0.5,  # 0.5 с, 1 с, 2 с между попытками
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET']),
+        respect_retry_after_header=True,
+    )
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=CRAWL_WORKERS, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+# Одна сессия на все потоки: соединения с сайтом переиспользуются
+http_session = create_http_session()
+
+# URL страницы -> {'etag', 'last_modified', 'items', 'page_count'}
+# По валидаторам сайт отвечает 304, и страницу не нужно ни качать, ни разбирать
+page_cache = {}
+page_cache_lock = Lock()
+
+site_rate_lock = Lock()
+site_next_slot = {}  # хост -> время (monotonic), раньше которого новый запрос слать нельзя
+
+def wait_for_site_slot(url):
+    """Общий для всех потоков лимит запросов к хосту"""
+    host = urlparse(url).netloc
+    with site_rate_lock:
+        now = time.monotonic()
+        slot = max(now, site_next_slot.get(host, 0))
+        site_next_slot[host] = slot + 1 / CRAWL_MAX_RPS
+    delay = slot - time.monotonic()
+    if delay > 0:
+        time.sleep(delay)
+
+def get_page_url(page):
+    return f"{SCHEDULE_URL}?limitstart={page * PAGE_SIZE}"
+
+def parse_page_count(html):
+    """Число страниц по ссылкам пагинации или счётчику «Страница 1 из N»"""
+    offsets = re.findall(r'limitstart=(\d+)', html)
+    if offsets:
+        return max(map(int, offsets)) // PAGE_SIZE + 1
+    
+    counter = re.search(r'Страница\s+\d+\s+из\s+(\d+)', html)
+    if counter:
+        return int(counter.group(1))
+    
+    return None
 
-    for lesson, first, second in schedule:
-        text += f"<b>{lesson}:</b>\n"
-        text += f"  ⏱️ <b>{first}</b> (1 подгруппа)\n"
-        text += f"  ⏱️ <b>{second}</b> (2 подгруппа)\n\n"
+MONTHS_RU = {
+    'янв': 1, 'фев': 2, 'мар': 3, 'апр': 4, 'май': 5, 'мая': 5, 'июн': 6,
+    'июл': 7, 'авг': 8, 'сен': 9, 'окт': 10, 'ноя': 11, 'дек': 12
+}
+SITE_DATE_RE = re.compile(r'(\d{1,2})\s*[-.\s]\s*([а-яё]{3})', re.I)
 
-    text += special
-    text += "══════════════════════"
+def parse_site_date(raw, today):
+    """
+    Превращает дату с сайта вида «3-мар» в date.
+    Год не указан, поэтому берётся тот, при котором дата ближе всего к today
+    (в декабре «5-янв» — это уже следующий год). None, если формат незнаком
+    """
+    match = SITE_DATE_RE.search(raw)
+    if not match:
+        return None
+    
+    day = int(match.group(1))
+    month = MONTHS_RU.get(match.group(2).lower())
+    if not month:
+        return None
+    
+    candidates = []
+    for year in (today.year - 1, today.year, today.year + 1):
+        try:
+            candidates.append(date(year, month, day))
+        except ValueError:
+            pass  # 29 февраля не в високосный год
+    if not candidates:
+        return None
+    
+    return min(candidates, key=lambda candidate: abs((candidate - today).days))
+
+MONTH_ABBR_RU = ('', 'янв', 'фев', 'мар', 'апр', 'май', 'июн',
+                 'июл', 'авг', 'сен', 'окт', 'ноя', 'дек')
+
+def format_site_date(day):
+    """date -> «3-мар», как даты пишут на сайте"""
+    return f"{day.day}-{MONTH_ABBR_RU[day.month]}"
+
+TABLE_RE = re.compile(r'<table\b.*?</table>', re.S | re.I)
+ROW_RE = re.compile(r'<tr\b[^>]*>(.*?)</tr>', re.S | re.I)
+ROW_OPEN_RE = re.compile(r'<tr\b', re.I)
+CELL_RE = re.compile(r'<td\b[^>]*>(.*?)</td>', re.S | re.I)
+CELL_OPEN_RE = re.compile(r'<td\b', re.I)
+TAG_RE = re.compile(r'<[^>]+>')
+
+def extract_table_html(html):
+    """Вырезает HTML первой таблицы страницы, None если таблицы нет"""
+    match = TABLE_RE.search(html)
+    return match.group(0) if match else None
+
+def cell_text(raw):
+    """Текст ячейки, как .text.strip() у BeautifulSoup"""
+    if '<' in raw:
+        raw = TAG_RE.sub('', raw)
+    if '&' in raw:
+        raw = unescape(raw)
+    return raw.strip()
+
+def parse_schedule_table(table_html, group_name=None):
+    """
+    Быстрый разбор строк таблицы регулярками, без построения дерева.
+    Если задана группа, ячейки чужих строк дальше колонки группы не декодируются.
+    При неожиданной разметке (незакрытые <tr>/<td>) разбирает через BeautifulSoup
+    """
+    rows = ROW_RE.findall(table_html)
+    if len(rows) != len(ROW_OPEN_RE.findall(table_html)):
+        return parse_schedule_table_soup(table_html, group_name)
+    
+    page_items = []
+    for row in rows[1:]:  # пропускаем заголовок
+        cells = CELL_RE.findall(row)
+        if len(cells) != len(CELL_OPEN_RE.findall(row)):
+            return parse_schedule_table_soup(table_html, group_name)
+        if len(cells) < 7:
+            continue
+        
+        group = cell_text(cells[1])
+        if group_name is not None and group != group_name:
+            continue
+        
+        page_items.append({
+            'date': cell_text(cells[0]),
+            'group': group,
+            'lesson_num': cell_text(cells[2]),
+            'subject': cell_text(cells[3]),
+            'teacher': cell_text(cells[4]),
+            'room': cell_text(cells[5])
+        })
+    
+    return page_items
 
-    return text
+def parse_schedule_table_soup(table_html, group_name=None):
+    """Запасной разбор таблицы через BeautifulSoup (lxml, если установлен)"""
+    from bs4 import BeautifulSoup, SoupStrainer
+    metrics.inc('btk_parse_soup_fallback_total')
+    
+    table = BeautifulSoup(table_html, SOUP_PARSER, parse_only=SoupStrainer('tr'))
+    
+    page_items = []
+    for row in table.find_all('tr')[1:]:  # пропускаем заголовок
+        cells = row.find_all('td')
+        if len(cells) < 7:
+            continue
+        
+        group = cells[1].text.strip()
+        if group_name is not None and group != group_name:
+            continue
+        
+        page_items.append({
+            'date': cells[0].text.strip(),
+            'group': group,
+            'lesson_num': cells[2].text.strip(),
+            'subject': cells[3].text.strip(),
+            'teacher': cells[4].text.strip(),
+            'room': cells[5].text.strip()
+        })
+    
+    return page_items
 
-# ---------- Парсинг расписания занятий (ВСЕ СТРАНИЦЫ) ----------
-def get_schedule_from_site(group_name):
-    base_url = "https://www.bartc.by/index.php/ru/obuchayushchemusya/dnevnoe-otdelenie/tekushchee-raspisanie"
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-        'Accept-Language': 'ru-RU,ru;q=0.8,en-US;q=0.5,en;q=0.3',
-        'Connection': 'keep-alive',
-    }
+def fetch_page(page):
+    """
+    Скачивает страницу условным GET. Таблица разбирается заново,
+    только если её HTML изменился с прошлого обхода.
+    Возвращает {'items', 'page_count', 'digest', 'status'}, где status:
+    'not_modified' — сайт ответил 304, 'same' — таблица не изменилась,
+    'parsed' — таблица разобрана заново
+    """
+    url = get_page_url(page)
+    with page_cache_lock:
+        cached = page_cache.get(url)
+    
+    headers = {}
+    if cached:
+        if cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+    
+    wait_for_site_slot(url)
+    with metrics.timer('btk_site_request_seconds'):
+        response = http_session.get(url, headers=headers, timeout=15)
+    metrics.inc('btk_site_bytes_total', len(response.content))
+    
+    if response.status_code == 304 and cached:
+        metrics.inc('btk_crawl_pages_total', status='not_modified')
+        return {'items': cached['items'], 'page_count': cached['page_count'],
+                'digest': cached['digest'], 'status': 'not_modified'}
+    
+    response.raise_for_status()
+    response.encoding = 'utf-8'
+    html = response.text
     
-    all_schedule_items = []
-    page = 0
-    limit = 20  # Сколько записей на странице
+    page_count = parse_page_count(html)
+    table_html = extract_table_html(html)
+    digest = hashlib.md5(table_html.encode('utf-8')).hexdigest() if table_html else None
+    
+    if cached and digest and cached['digest'] == digest:
+        page_items = cached['items']
+        status = 'same'
+    else:
+        with metrics.timer('btk_page_parse_seconds'):
+            page_items = parse_schedule_table(table_html) if table_html else []
+        status = 'parsed'
+    metrics.inc('btk_crawl_pages_total', status=status)
+    
+    with page_cache_lock:
+        page_cache[url] = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'digest': digest,
+            'items': page_items,
+            'page_count': page_count,
+        }
+    
+    return {'items': page_items, 'page_count': page_count, 'digest': digest, 'status': status}
+
+def fetch_schedule_pages():
+    """
+    Обходит все страницы таблицы и возвращает результаты fetch_page по порядку.
+    Число страниц берётся с первой страницы, остальные качаются параллельно
+    (не больше CRAWL_WORKERS сразу и CRAWL_MAX_RPS в секунду).
+    Если число страниц узнать не удалось, страницы перебираются пачками,
+    пока не встретится пустая или повтор предыдущей (Joomla отдаёт последнюю
+    страницу на limitstart за концом таблицы). При любой ошибке возвращает пустой список
+    """
+    started = time.time()
     
     try:
-        while True:
-            # Формируем URL с параметрами пагинации
-            url = f"{base_url}?limitstart={page * limit}"
-            
-            print(f"🔄 Загружаю страницу {page + 1}...")
-            response = requests.get(url, headers=headers, timeout=15)
-            response.encoding = 'utf-8'
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Ищем таблицу
-            table = soup.find('table')
-            if not table:
-                print(f"❌ На странице {page + 1} нет таблицы")
-                break
-            
-            # Парсим строки таблицы
-            rows = table.find_all('tr')[1:]  # пропускаем заголовок
-            print(f"📊 Страница {page + 1}: найдено {len(rows)} строк")
-            
-            if not rows:
-                print(f"✅ Достигнут конец данных")
-                break
-            
-            page_items = 0
-            for row in rows:
-                cells = row.find_all('td')
-                if len(cells) >= 7:
-                    date = cells[0].text.strip()
-                    group = cells[1].text.strip()
-                    lesson_num = cells[2].text.strip()
-                    subject = cells[3].text.strip()
-                    teacher = cells[4].text.strip()
-                    room = cells[5].text.strip()
-                    
-                    if group == group_name:
-                        all_schedule_items.append({
-                            'date': date,
-                            'lesson_num': lesson_num,
-                            'subject': subject,
-                            'teacher': teacher,
-                            'room': room
-                        })
-                        page_items += 1
-            
-            print(f"✅ Страница {page + 1}: найдено {page_items} занятий для группы {group_name}")
-            
-            # Проверяем, есть ли следующая страница
-            next_link = soup.find('a', title='Вперед')
-            if not next_link:
-                next_link = soup.find('a', class_='next')
-            if not next_link:
-                next_link = soup.find('a', text=lambda t: t and ('далее' in t.lower() or 'next' in t.lower() or '>' in t))
-            
-            if not next_link:
-                print("✅ Это последняя страница")
-                break
-            
-            page += 1
-            time.sleep(1)  # Задержка, чтобы не нагружать сайт
-            
-        print(f"🎯 ВСЕГО найдено {len(all_schedule_items)} занятий для группы {group_name}")
-        return all_schedule_items
+        print("🔄 Загружаю страницу 1...")
+        first = fetch_page(0)
+        if not first['items']:
+            print("❌ На первой странице нет занятий")
+            return []
+        
+        results = [first]
+        page_count = first['page_count']
+        
+        with ThreadPoolExecutor(max_workers=CRAWL_WORKERS) as executor:
+            if page_count:
+                page_count = min(page_count, MAX_PAGES)
+                print(f"📑 Страниц в таблице: {page_count}")
+                results.extend(executor.map(fetch_page, range(1, page_count)))
+            else:
+                print("📑 Число страниц неизвестно, перебираю по limitstart")
+                page = 1
+                finished = False
+                while page < MAX_PAGES and not finished:
+                    batch = list(executor.map(fetch_page, range(page, min(page + CRAWL_WORKERS, MAX_PAGES))))
+                    for result in batch:
+                        if not result['items'] or result['digest'] == results[-1]['digest']:
+                            finished = True
+                            break
+                        results.append(result)
+                    page += len(batch)
+        
+        # Пустые страницы в конце таблицы не нужны
+        while results and not results[-1]['items']:
+            results.pop()
+        
+        total = sum(len(result['items']) for result in results)
+        parsed = sum(1 for result in results if result['status'] == 'parsed')
+        not_modified = sum(1 for result in results if result['status'] == 'not_modified')
+        print(f"🎯 ВСЕГО найдено {total} занятий на {len(results)} страницах за {time.time() - started:.1f} с "
+              f"(разобрано: {parsed}, ответ 304: {not_modified})")
+        metrics.observe('btk_crawl_seconds', time.time() - started)
+        return results
         
     except requests.exceptions.RequestException as e:
         print(f"❌ Ошибка запроса: {e}")
+        metrics.inc('btk_crawl_errors_total')
         return []
     except Exception as e:
         print(f"❌ Неизвестная ошибка: {e}")
         import traceback
         traceback.print_exc()
+        metrics.inc('btk_crawl_errors_total')
         return []
 
-def get_lesson_time(lesson_num, day_of_week):
+# ---------- ОДИН ЗАПРОС НА ВСЕХ (single-flight) ----------
+# Двадцать одновременных нажатий дают один обход сайта: первый вызов
+# запускает работу, остальные ждут её результат
+SINGLE_FLIGHT_TIMEOUT = 20  # Сколько секунд пользователь ждёт общий обход сайта
+
+inflight = {}  # ключ -> {'done': Event, 'result': ..., 'waiters': [функции на завершение]}
+inflight_lock = Lock()
+
+def single_flight(key, func, timeout=None):
     """
-    Возвращает время начала и конца пары по номеру и дню недели
+    Выполняет func() в отдельном потоке один раз на все одновременные вызовы
+    с одинаковым ключом. Каждый вызов ждёт результат не дольше timeout
+    (None — без ограничения, 0 — только запустить).
+    Возвращает результат func() или None при ошибке и по таймауту
     """
-    # ПН, СР, ПТ
-    mon_wed_fri = {
-        1: "8.00 – 9.40",
-        2: "9.50 – 11.45",
-        3: "12.20 – 14.00",
-        4: "14.10 – 15.50",
-        5: "16.00 – 17.40",
-        6: "17.50 – 19.30"
-    }
+    with inflight_lock:
+        call = inflight.get(key)
+        if call is None:
+            call = {'done': Event(), 'result': None, 'waiters': []}
+            inflight[key] = call
+            leader = True
+        else:
+            leader = False
+    
+    if leader:
+        def run():
+            try:
+                call['result'] = func()
+            except Exception as e:
+                print(f"❌ Ошибка в задаче {key}: {e}")
+            finally:
+                with inflight_lock:
+                    del inflight[key]
+                call['done'].set()
+                for waiter in call['waiters']:
+                    waiter()
+        
+        Thread(target=run, name=f'single-flight-{key}', daemon=True).start()
+    
+    if not call['done'].wait(timeout):
+        if timeout:
+            print(f"⏱️ Не дождались {key} за {timeout} с")
+        return None
+    return call['result']
 
-    # ВТ
-    tuesday = {
-        1: "8.00 – 9.40",
-        2: "9.50 – 11.45",
-        3: "12.20 – 14.00",
-        4: "15.05 – 16.45",
-        5: "16.55 – 18.35",
-        6: "18.45 – 20.25"
+def when_done(key, callback):
+    """
+    Вызывает callback() после завершения идущей задачи key, не занимая
+    поток на ожидание. False — такой задачи сейчас нет
+    """
+    with inflight_lock:
+        call = inflight.get(key)
+        if call is None:
+            return False
+        call['waiters'].append(callback)
+    return True
+
+# ---------- СНИМОК РАСПИСАНИЯ ----------
+# Вся таблица хранится в памяти, разложенная по группам. Снимок обновляет
+# планировщик в фоне, а кнопки всегда отвечают из последнего снимка:
+# старше SNAPSHOT_SOFT_TTL — отвечаем и запускаем обновление в фоне,
+# старше SNAPSHOT_HARD_TTL — ждём обновления
+SNAPSHOT_SOFT_TTL = 15 * 60     # После этого ответ помечается «обновлено N мин назад»
+SNAPSHOT_HARD_TTL = 2 * 60 * 60 # После этого пользователь ждёт свежих данных
+
+schedule_snapshot = {
+    'version': 0,      # Номер снимка, растёт при каждом изменении данных
+    'updated_at': 0,   # time.time() последнего обновления
+    'changed_at': 0,   # time.time() последнего изменения данных
+    'groups': {},      # группа -> список занятий
+    'days': {},        # группа -> индекс занятий по датам (build_date_index)
+    'pages': [],           # Занятия каждой страницы по порядку
+    'hash': None,          # Хеш всей таблицы
+    'page_digests': [],    # Хеш HTML таблицы каждой страницы
+    'group_digests': {},   # группа -> хеш её занятий
+    'delta': [],           # Изменения относительно предыдущей версии
+}
+snapshot_lock = Lock()  # Защищает замену снимка
+SNAPSHOT_KEY = 'schedule-table'  # Ключ обхода всей таблицы для single_flight
+
+def build_group_index(items):
+    """Раскладывает занятия всей таблицы по группам"""
+    groups = {}
+    for item in items:
+        groups.setdefault(item['group'], []).append(item)
+    return groups
+
+def lesson_number(item):
+    return int(item['lesson_num']) if item['lesson_num'].isdigit() else 0
+
+def build_date_index(items, today):
+    """
+    Раскладывает занятия группы по настоящим датам (год подбирается в
+    parse_site_date). Возвращает {'by_date': {date: занятия по порядку пар},
+    'dates': отсортированные даты}. Занятия с незнакомой датой лежат
+    под ключом None и в 'dates' не попадают
+    """
+    by_date = {}
+    for item in items:
+        by_date.setdefault(parse_site_date(item['date'], today), []).append(item)
+    for day_items in by_date.values():
+        day_items.sort(key=lesson_number)
+    
+    return {
+        'by_date': by_date,
+        'dates': sorted(day for day in by_date if day is not None),
     }
 
-    # ЧТ
-    thursday = {
-        1: "8.00 – 9.40",
-        2: "9.50 – 11.45",
-        3: "12.20 – 14.00",
-        4: "14.45 – 16.25",
-        5: "16.35 – 18.15",
-        6: "18.25 – 20.05"
-    }
+EMPTY_DATE_INDEX = {'by_date': {}, 'dates': []}
 
-    # СБ
-    saturday = {
-        1: "8.00 – 9.40",
-        2: "9.50 – 11.30",
-        3: "11.50 – 13.25",
-        4: "13.35 – 15.15",
-        5: "15.25 – 17.05"
-    }
+def lessons_in_range(index, date_from=None, date_to=None):
+    """[(дата, занятия)] из индекса за диапазон дат включительно, по порядку"""
+    dates = index['dates']
+    lo = bisect_left(dates, date_from) if date_from else 0
+    hi = bisect_right(dates, date_to) if date_to else len(dates)
+    return [(day, index['by_date'][day]) for day in dates[lo:hi]]
+
+def lesson_key(item):
+    return (item['group'], item['date'], item['lesson_num'])
+
+def diff_lessons(old_items, new_items):
+    """
+    Сравнивает два списка занятий по ключу (группа, дата, пара).
+    Возвращает список изменений {'type', 'old', 'new'}, где type —
+    'added', 'removed' или 'modified'
+    """
+    old_by_key = {}
+    for item in old_items:
+        old_by_key.setdefault(lesson_key(item), []).append(item)
+    new_by_key = {}
+    for item in new_items:
+        new_by_key.setdefault(lesson_key(item), []).append(item)
+    
+    delta = []
+    for key in sorted(old_by_key.keys() | new_by_key.keys()):
+        old = old_by_key.get(key, [])
+        new = new_by_key.get(key, [])
+        if old == new:
+            continue
+        
+        removed = [item for item in old if item not in new]
+        added = [item for item in new if item not in old]
+        if len(removed) == 1 and len(added) == 1:
+            delta.append({'type': 'modified', 'old': removed[0], 'new': added[0]})
+            continue
+        delta.extend({'type': 'removed', 'old': item, 'new': None} for item in removed)
+        delta.extend({'type': 'added', 'old': None, 'new': item} for item in added)
+    
+    return delta
 
-    if day_of_week in [0, 2, 4]:  # ПН, СР, ПТ
-        return mon_wed_fri.get(lesson_num)
-    elif day_of_week == 1:  # ВТ
-        return tuesday.get(lesson_num)
-    elif day_of_week == 3:  # ЧТ
-        return thursday.get(lesson_num)
-    elif day_of_week == 5:  # СБ
-        return saturday.get(lesson_num)
+def merge_snapshot(previous, results):
+    """
+    Собирает новый снимок из результатов обхода. Хеши и разница считаются
+    только для групп, встречающихся на изменившихся страницах
+    """
+    pages = [result['items'] for result in results]
+    page_digests = [result['digest'] for result in results]
+    old_pages = previous['pages']
+    old_digests = previous['page_digests']
+    
+    changed_pages = [
+        i for i in range(max(len(pages), len(old_pages)))
+        if i >= len(pages) or i >= len(old_pages) or page_digests[i] != old_digests[i]
+    ]
+    
+    if previous['version'] and not changed_pages:
+        return dict(previous, updated_at=time.time(), delta=[])
+    
+    groups = build_group_index(item for page_items in pages for item in page_items)
+    today = datetime.now().date()
+    
+    if previous['version']:
+        touched = set()
+        for i in changed_pages:
+            for page_items in (pages[i:i + 1], old_pages[i:i + 1]):
+                touched.update(item['group'] for items in page_items for item in items)
     else:
+        touched = set(groups)
+    
+    # Индекс по датам пересобирается только для затронутых групп
+    days = {group: previous['days'][group] for group in groups
+            if group not in touched and group in previous['days']}
+    group_digests = dict(previous['group_digests'])
+    delta = []
+    for group in sorted(touched):
+        if group in groups:
+            group_digests[group] = get_digest(groups[group])
+            days[group] = build_date_index(groups[group], today)
+        else:
+            group_digests.pop(group, None)
+        if previous['version']:
+            delta.extend(diff_lessons(previous['groups'].get(group, []), groups.get(group, [])))
+    
+    now = time.time()
+    return {
+        'version': previous['version'] + 1,
+        'updated_at': now,
+        'changed_at': now if previous['version'] else 0,
+        'groups': groups,
+        'days': days,
+        'pages': pages,
+        'hash': get_digest(group_digests),
+        'page_digests': page_digests,
+        'group_digests': group_digests,
+        'delta': delta,
+    }
+
+def refresh_snapshot():
+    """Обходит сайт и публикует новый снимок. При ошибке оставляет старый"""
+    global schedule_snapshot, refresh_failures, last_refresh_failure
+    
+    results = fetch_schedule_pages()
+    if not results:
+        print("⚠️ Сайт не вернул данных, оставляю предыдущий снимок")
+        refresh_failures += 1
+        last_refresh_failure = time.time()
         return None
+    refresh_failures = 0
+    
+    with snapshot_lock:
+        previous_version = schedule_snapshot['version']
+        schedule_snapshot = merge_snapshot(schedule_snapshot, results)
+        snapshot = schedule_snapshot
+    
+    print(f"📸 Снимок v{snapshot['version']}: {len(snapshot['groups'])} групп, "
+          f"изменений: {len(snapshot['delta'])}")
+    
+    if snapshot['version'] != previous_version:
+        save_lessons(snapshot['days'])
+    # Новые ETag тоже стоит сохранить, даже если данные не изменились
+    if snapshot['version'] != previous_version or any(result['status'] != 'not_modified' for result in results):
+        save_snapshot_state(snapshot)
+    return snapshot
+
+def refresh_shared(timeout=None):
+    """
+    Обновляет снимок, присоединяясь к уже идущему обходу сайта.
+    Возвращает новый снимок или None (ошибка или не дождались за timeout)
+    """
+    return single_flight(SNAPSHOT_KEY, refresh_snapshot, timeout)
+
+def trigger_background_refresh():
+    """Запускает обновление снимка в фоне, если оно ещё не идёт"""
+    single_flight(SNAPSHOT_KEY, refresh_snapshot, timeout=0)
+
+def snapshot_usable(snapshot):
+    """Можно ли отвечать из снимка, не дожидаясь обхода сайта"""
+    return bool(snapshot['version']) and time.time() - snapshot['updated_at'] < SNAPSHOT_HARD_TTL
+
+def snapshot_read_waits(snapshot):
+    """Придётся ли get_snapshot ждать обход сайта"""
+    return not snapshot_usable(snapshot) and not refresh_backoff_active()
 
-def format_schedule_with_day(schedule, group_name, target_day, period_name):
-    """Форматирует расписание с учетом конкретного дня недели для времени пар"""
-    if not schedule:
-        return f"😕 Нет расписания для группы {group_name}"
-    
-    # Словарь для перевода дня недели
-    days_ru = {
-        0: "ПОНЕДЕЛЬНИК",
-        1: "ВТОРНИК", 
-        2: "СРЕДА",
-        3: "ЧЕТВЕРГ",
-        4: "ПЯТНИЦА",
-        5: "СУББОТА",
-        6: "ВОСКРЕСЕНЬЕ"
+def refresh_backoff_active():
+    """Недавний обход сайта не удался — следующий не раньше, чем через get_refresh_interval()"""
+    return bool(refresh_failures) and time.time() - last_refresh_failure < get_refresh_interval()
+
+def get_snapshot():
+    """
+    Снимок для ответа пользователю. Не ждёт сайт, пока снимок моложе
+    SNAPSHOT_HARD_TTL; если он старше SNAPSHOT_SOFT_TTL — обновляет его в фоне.
+    Пока сайт недоступен, отвечает тем, что есть, не дожидаясь нового обхода
+    """
+    snapshot = schedule_snapshot
+    if snapshot_usable(snapshot):
+        if time.time() - snapshot['updated_at'] >= SNAPSHOT_SOFT_TTL:
+            metrics.inc('btk_snapshot_reads_total', result='stale')
+            trigger_background_refresh()
+        else:
+            metrics.inc('btk_snapshot_reads_total', result='fresh')
+        return snapshot
+    
+    if refresh_backoff_active():
+        # Сайт лежит: устаревший снимок (или база) сразу, с пометкой о давности
+        metrics.inc('btk_snapshot_reads_total', result='backoff')
+        return snapshot
+    
+    # Снимка нет или он слишком старый — ждём общий обход сайта,
+    # но не дольше SINGLE_FLIGHT_TIMEOUT, потом отвечаем тем, что есть
+    metrics.inc('btk_snapshot_reads_total', result='wait')
+    return refresh_shared(SINGLE_FLIGHT_TIMEOUT) or schedule_snapshot
+
+def get_group_schedule(group_name):
+    """
+    Занятия группы из снимка, а пока снимка нет — из базы.
+    Возвращает (индекс по датам из build_date_index, время обновления
+    снимка, версия снимка); если данные из базы, время и версия — None
+    """
+    snapshot = get_snapshot()
+    if snapshot['version']:
+        return snapshot['days'].get(group_name, EMPTY_DATE_INDEX), snapshot['updated_at'], snapshot['version']
+    
+    # Сайт недоступен, а снимка ещё нет (например, сразу после перезапуска)
+    today = datetime.now().date()
+    return build_date_index(load_lessons(group_name, date_from=today), today), None, None
+
+def peek_group_schedule(group_name):
+    """
+    Как get_group_schedule, но никогда не ждёт сайт: отвечает из текущего
+    снимка (устаревший обновляется в фоне), а без снимка — из базы
+    """
+    snapshot = schedule_snapshot
+    if snapshot['version']:
+        if time.time() - snapshot['updated_at'] >= SNAPSHOT_SOFT_TTL:
+            trigger_background_refresh()
+        return snapshot['days'].get(group_name, EMPTY_DATE_INDEX), snapshot['updated_at'], snapshot['version']
+    
+    today = datetime.now().date()
+    return build_date_index(load_lessons(group_name, date_from=today), today), None, None
+
+def format_data_age(updated_at):
+    """Пометка о давности данных для ответа, пустая строка если данные свежие"""
+    if updated_at is None:
+        return "\n\n⚠️ <i>Сайт колледжа недоступен, показана сохранённая копия</i>"
+    minutes = int((time.time() - updated_at) // 60)
+    if minutes * 60 < SNAPSHOT_SOFT_TTL:
+        return ""
+    return f"\n\n🕒 <i>Обновлено {minutes} мин назад</i>"
+
+# ---------- ФОНОВОЕ ОБНОВЛЕНИЕ СНИМКА ----------
+REFRESH_INTERVAL_DAY = 10 * 60     # Днём, пока идут занятия
+REFRESH_INTERVAL_NIGHT = 60 * 60   # Ночью расписание почти не меняют
+REFRESH_INTERVAL_HOT = 3 * 60      # Первый час после найденного изменения
+REFRESH_INTERVAL_MAX_ERROR = 15 * 60
+
+background_scheduler = None
+refresh_failures = 0      # Сколько обновлений подряд закончились ошибкой
+last_refresh_failure = 0  # Когда был последний неудачный обход (time.time())
+
+def get_refresh_interval():
+    """Через сколько секунд обновлять снимок в следующий раз"""
+    if refresh_failures:
+        # Сайт лежит: 1, 2, 4, 8... минут, но не больше REFRESH_INTERVAL_MAX_ERROR
+        return min(60 * 2 ** (refresh_failures - 1), REFRESH_INTERVAL_MAX_ERROR)
+    if time.time() - schedule_snapshot['changed_at'] < 60 * 60:
+        return REFRESH_INTERVAL_HOT
+    if 7 <= datetime.now().hour < 21:
+        return REFRESH_INTERVAL_DAY
+    return REFRESH_INTERVAL_NIGHT
+
+def schedule_next_refresh():
+    interval = get_refresh_interval()
+    background_scheduler.add_job(
+        refresh_job,
+        trigger='date',
+        run_date=datetime.now() + timedelta(seconds=interval),
+        id='snapshot_refresh',
+        replace_existing=True
+    )
+
+def refresh_job():
+    """Фоновое обновление снимка, само выбирает время следующего запуска"""
+    # Ошибки обхода учитывает refresh_snapshot: по ним же get_snapshot
+    # решает, стоит ли пользователю ждать сайт
+    try:
+        refresh_shared()
+    except Exception as e:
+        print(f"❌ Ошибка фонового обновления: {e}")
+    finally:
+        schedule_next_refresh()
+
+# ---------- СОХРАНЕНИЕ СОСТОЯНИЯ ----------
+# Снимок с валидаторами страниц и то, о чём подписчики уже знают, лежат в
+# таблице state. После перезапуска бот сразу отвечает из снимка, обход сайта
+# получает 304 вместо полной загрузки, а изменения, сделанные на сайте, пока
+# бот не работал, попадают в первую же проверку и рассылку
+STATE_SNAPSHOT_KEY = 'snapshot'
+STATE_NOTIFIED_KEY = 'notified'
+
+def save_snapshot_state(snapshot):
+    """Сохраняет снимок вместе с ETag/Last-Modified его страниц одной транзакцией"""
+    validators = []
+    with page_cache_lock:
+        for i in range(len(snapshot['pages'])):
+            url = get_page_url(i)
+            cached = page_cache.get(url)
+            validators.append({
+                'url': url,
+                'etag': cached['etag'],
+                'last_modified': cached['last_modified'],
+                'page_count': cached['page_count'],
+            } if cached else None)
+    
+    state = {
+        'version': snapshot['version'],
+        'updated_at': snapshot['updated_at'],
+        'changed_at': snapshot['changed_at'],
+        'pages': snapshot['pages'],
+        'hash': snapshot['hash'],
+        'page_digests': snapshot['page_digests'],
+        'group_digests': snapshot['group_digests'],
+        'validators': validators,
+    }
+    try:
+        db.save_state({STATE_SNAPSHOT_KEY: state})
+    except Exception as e:
+        print(f"❌ Ошибка сохранения снимка: {e}")
+
+def save_notified_state():
+    """Сохраняет состояние последней проверки (с чем сравнивать следующую)"""
+    state = {
+        'hash': previous_schedule_hash,
+        'page_digests': previous_page_digests,
+        'group_digests': previous_group_digests,
+        'groups': previous_groups,
     }
+    try:
+        db.save_state({STATE_NOTIFIED_KEY: state})
+    except Exception as e:
+        print(f"❌ Ошибка сохранения состояния проверки: {e}")
+
+def restore_state():
+    """
+    Загружает снимок, валидаторы страниц и состояние проверки после перезапуска.
+    Если сохранённое не читается (например, другой формат), бот стартует с нуля
+    """
+    global schedule_snapshot
+    global previous_schedule_hash, previous_page_digests, previous_group_digests, previous_groups
     
-    text = f"📚 <b>РАСПИСАНИЕ {period_name}</b>\n"
-    text += f"👥 <b>Группа {group_name}</b>\n"
-    if period_name in ["СЕГОДНЯ", "ЗАВТРА"]:
-        text += f"📅 <b>{days_ru[target_day]}</b>\n"
-    text += "══════════════════════\n"
+    try:
+        saved = db.load_state(STATE_SNAPSHOT_KEY)
+        notified = db.load_state(STATE_NOTIFIED_KEY)
+        
+        # Сначала собираем всё, глобальные переменные меняем только если всё прочиталось
+        snapshot = None
+        cached_pages = {}
+        if saved:
+            pages = saved['pages']
+            groups = build_group_index(item for page_items in pages for item in page_items)
+            today = datetime.now().date()
+            snapshot = {
+                'version': saved['version'],
+                'updated_at': saved['updated_at'],
+                'changed_at': saved['changed_at'],
+                'groups': groups,
+                'days': {group: build_date_index(items, today) for group, items in groups.items()},
+                'pages': pages,
+                'hash': saved['hash'],
+                'page_digests': saved['page_digests'],
+                'group_digests': saved['group_digests'],
+                'delta': [],
+            }
+            for i, validators in enumerate(saved['validators']):
+                if validators:
+                    cached_pages[validators['url']] = {
+                        'etag': validators['etag'],
+                        'last_modified': validators['last_modified'],
+                        'digest': saved['page_digests'][i],
+                        'items': pages[i],
+                        'page_count': validators['page_count'],
+                    }
+        
+        checked = None
+        if notified:
+            checked = (notified['hash'], notified['page_digests'], notified['group_digests'], notified['groups'])
+    except Exception as e:
+        print(f"❌ Ошибка восстановления сохранённого состояния, начинаю с нуля: {e}")
+        return
+    
+    if snapshot:
+        schedule_snapshot = snapshot
+        with page_cache_lock:
+            page_cache.update(cached_pages)
+        age = int((time.time() - snapshot['updated_at']) // 60)
+        print(f"♻️ Восстановлен снимок v{snapshot['version']} ({len(snapshot['groups'])} групп, {age} мин назад)")
+    
+    if checked:
+        previous_schedule_hash, previous_page_digests, previous_group_digests, previous_groups = checked
+        print(f"♻️ Восстановлено состояние проверки: хеш {str(previous_schedule_hash)[:8]}...")
+
+restore_state()
+
+def get_lesson_time(lesson_num, day_of_week):
+    """
+    Возвращает время начала и конца пары по номеру и дню недели
+    """
+    return LESSON_TIMES.get(day_of_week, {}).get(lesson_num)
+
+def format_schedule_with_day(days, group_name, target_day, period_name):
+    """
+    Форматирует расписание с учетом дня недели для времени пар.
+    days — [(дата или None, занятия по порядку пар)] в порядке показа.
+    Возвращает блоки: шапка, по блоку на каждый день, итог. Теги в каждом
+    блоке закрыты, поэтому длинное расписание можно резать между ними
+    """
+    if not days:
+        return [f"😕 Нет расписания для группы {escape(group_name)}"]
     
-    # Группируем по датам
-    dates = {}
-    for item in schedule:
-        if item['date'] not in dates:
-            dates[item['date']] = []
-        dates[item['date']].append(item)
+    header = [
+        f"📚 <b>РАСПИСАНИЕ {period_name}</b>\n",
+        f"👥 <b>Группа {escape(group_name)}</b>\n",
+    ]
+    if period_name in ["СЕГОДНЯ", "ЗАВТРА"]:
+        header.append(f"📅 <b>{DAY_NAMES_RU[target_day]}</b>\n")
+    header.append("══════════════════════\n")
+    blocks = ["".join(header)]
     
-    # Сортируем даты
     total_count = 0
     
-    for date in sorted(dates.keys()):
-        text += f"\n📅 <b>{date}</b>\n"
-        text += "──────────────────\n"
-        
-        # Сортируем по номеру пары
-        sorted_items = sorted(dates[date], key=lambda x: int(x['lesson_num']) if x['lesson_num'].isdigit() else 0)
+    for day, items in days:
+        # Время пар зависит от дня недели самой даты
+        weekday = day.weekday() if day else target_day
+        parts = [
+            f"\n📅 <b>{escape(items[0]['date'])}</b>\n",
+            "──────────────────\n",
+        ]
         
-        for item in sorted_items:
+        for item in items:
             total_count += 1
-            text += f"<b>{item['lesson_num']} пара:</b>\n"
-            text += f"📖 <b>{item['subject']}</b>\n"
-            text += f"👨‍🏫 {item['teacher']}\n"
-            text += f"🚪 Кабинет: {item['room']}\n"
+            parts.append(f"<b>{escape(item['lesson_num'])} пара:</b>\n")
+            parts.append(f"📖 <b>{escape(item['subject'])}</b>\n")
+            parts.append(f"👨‍🏫 {escape(item['teacher'])}\n")
+            parts.append(f"🚪 Кабинет: {escape(item['room'])}\n")
             
             if item['lesson_num'].isdigit():
-                lesson_time = get_lesson_time(int(item['lesson_num']), target_day)
+                lesson_time = get_lesson_time(int(item['lesson_num']), weekday)
                 if lesson_time:
-                    text += f"⏱️ {lesson_time}\n"
+                    parts.append(f"⏱️ {lesson_time}\n")
             
-            text += "\n"
+            parts.append("\n")
+        blocks.append("".join(parts))
+    
+    blocks.append(f"══════════════════════\n📊 <b>Всего пар:</b> {total_count}")
+    
+    return blocks
+
+def render_schedule(index, group, period, now):
+    """
+    Ответ на кнопку расписания (без пометки о давности данных) — кортеж
+    блоков для pack_messages. index — занятия группы по датам из build_date_index
+    """
+    today = now.date()
+    
+    if period in ('today', 'tomorrow'):
+        if period == 'today':
+            target = today
+            period_name = "СЕГОДНЯ"
+        else:
+            target = today + timedelta(days=1)
+            period_name = "ЗАВТРА"
+        target_date = format_site_date(target)
+        
+        items = index['by_date'].get(target)
+        print(f"✅ Группа {group}, {period_name.lower()} ({target_date}): {len(items or [])} занятий")
+        
+        if items:
+            return tuple(format_schedule_with_day([(target, items)], group, target.weekday(), period_name))
+        
+        if period == 'today':
+            # Показываем ближайшие доступные даты
+            dates_list = "\n".join(
+                escape(index['by_date'][day][0]['date']) for day in index['dates'][:10]
+            )
+            return (
+                f"😕 <b>Нет расписания на сегодня</b>\n\n"
+                f"Для группы {escape(group)} не найдено занятий на {target_date}.\n\n"
+                f"📅 <b>Доступные даты:</b>\n{dates_list}\n\n"
+                f"Попробуй посмотреть всё расписание (📚 Неделя)",
+            )
+        return (
+            f"😕 <b>Нет расписания на завтра</b>\n\n"
+            f"Для группы {escape(group)} не найдено занятий на {target_date}.\n\n"
+            f"Попробуй посмотреть всё расписание (📚 Неделя)",
+        )
+    
+    # Для недели показываем всё расписание по порядку дат,
+    # занятия с нераспознанной датой — в конце
+    days = lessons_in_range(index)
+    if None in index['by_date']:
+        days.append((None, index['by_date'][None]))
+    print(f"✅ Группа {group}, неделя: {sum(len(items) for _, items in days)} занятий")
+    return tuple(format_schedule_with_day(days, group, today.weekday(), "НА БЛИЖАЙШИЕ ДНИ"))
+
+# ---------- РАЗБИВКА ДЛИННЫХ СООБЩЕНИЙ ----------
+# Расписание на много дней не влезает в одно сообщение. Блоки из
+# format_schedule_with_day укладываются по порядку в как можно меньше
+# сообщений, разрез всегда между блоками (или строками), поэтому теги не рвутся
+MESSAGE_LIMIT = 4096  # Символов в сообщении Telegram после разбора HTML
+
+def visible_length(html_text):
+    """Длина текста, как её считает Telegram: без тегов, в единицах UTF-16"""
+    return len(unescape(TAG_RE.sub('', html_text)).encode('utf-16-le')) // 2
+
+def split_block(block, limit):
+    """Режет слишком длинный блок по строкам, а строку длиннее limit — без разметки"""
+    pieces = []
+    for line in block.splitlines(keepends=True):
+        if visible_length(line) <= limit:
+            pieces.append(line)
+            continue
+        plain = unescape(TAG_RE.sub('', line))
+        step = limit // 2  # Эмодзи занимают две единицы UTF-16
+        pieces.extend(escape(plain[i:i + step], quote=False) for i in range(0, len(plain), step))
+    return pieces
+
+def pack_messages(blocks, limit=MESSAGE_LIMIT):
+    """
+    Собирает блоки по порядку в наименьшее число сообщений не длиннее limit
+    (жадная укладка подряд идущих блоков здесь оптимальна)
+    """
+    messages = []
+    current = []
+    current_length = 0
+    for block in blocks:
+        pieces = [block] if visible_length(block) <= limit else split_block(block, limit)
+        for piece in pieces:
+            length = visible_length(piece)
+            if current and current_length + length > limit:
+                messages.append("".join(current))
+                current = []
+                current_length = 0
+            if not current:
+                # Пустые строки в начале сообщения Telegram всё равно срезает
+                piece = piece.lstrip("\n")
+                if not piece:
+                    continue
+                length = visible_length(piece)
+            current.append(piece)
+            current_length += length
+    if current:
+        messages.append("".join(current))
+    return messages
+
+def send_chunks(chat_id, placeholder_id, messages):
+    """Первое сообщение заменяет заглушку «Ищу расписание», остальные отправляются следом"""
+    try:
+        bot.edit_message_text(messages[0], chat_id, placeholder_id, parse_mode='HTML')
+    except Exception as e:
+        print(f"Ошибка при редактировании: {e}")
+        bot.send_message(chat_id, messages[0], parse_mode='HTML')
+    for text in messages[1:]:
+        bot.send_message(chat_id, text, parse_mode='HTML')
+
+def describe_pair_lessons(items):
+    """Строки о занятиях группы на одной паре"""
+    parts = []
+    for item in items:
+        parts.append(f"📖 <b>{escape(item['subject'])}</b>\n")
+        parts.append(f"👨‍🏫 {escape(item['teacher'])}\n")
+        parts.append(f"🚪 Кабинет: {escape(item['room'])}\n")
+    return "".join(parts)
+
+def render_now(index, group, now):
+    """Текст кнопки «Сейчас»: идущая и следующая пара группы"""
+    today = now.date()
+    minute = now.hour * 60 + now.minute
+    
+    # Занятия группы на сегодня по номеру пары
+    lessons = {}
+    for item in index['by_date'].get(today, []):
+        if item['lesson_num'].isdigit():
+            lessons.setdefault(int(item['lesson_num']), []).append(item)
+    
+    parts = [
+        f"⏳ <b>СЕЙЧАС</b> · {format_clock(minute)}\n",
+        f"👥 <b>Группа {escape(group)}</b>\n",
+        "══════════════════════\n\n",
+    ]
+    
+    if not lessons:
+        parts.append("🎉 Сегодня занятий нет")
+        return "".join(parts)
+    
+    current, upcoming = find_pairs(today.weekday(), minute)
+    upcoming = [pair for pair in upcoming if pair[0] in lessons]
+    
+    if current and current[0] in lessons:
+        num, start, end, spans = current
+        parts.append(f"▶️ <b>Идёт {num} пара</b> ({format_clock(start)} – {format_clock(end)}), "
+                     f"до конца {end - minute} мин\n")
+        for half, (half_start, half_end) in enumerate(spans, 1):
+            if minute < half_start:
+                parts.append(f"☕ Перерыв, {half} подгруппа начинает в {format_clock(half_start)}\n")
+                break
+            if minute < half_end:
+                parts.append(f"⏱️ {half} подгруппа до {format_clock(half_end)}\n")
+                break
+        parts.append(describe_pair_lessons(lessons[num]))
+        parts.append("\n")
+    elif upcoming:
+        parts.append(f"☕ Сейчас пары нет, до начала {upcoming[0][1] - minute} мин\n\n")
+    
+    if upcoming:
+        num, start, end, _ = upcoming[0]
+        parts.append(f"⏭ <b>Следующая: {num} пара</b> в {format_clock(start)}\n")
+        parts.append(describe_pair_lessons(lessons[num]))
+    elif not (current and current[0] in lessons):
+        parts.append("✅ Пары на сегодня закончились")
+    else:
+        parts.append("🏁 Это последняя пара на сегодня")
+    
+    return "".join(parts)
+
+# ---------- НЕДЕЛЯ ПО ДНЯМ ----------
+# 📚 Неделя показывает один день, листание — кнопками ◀️/▶️. В кнопке
+# записаны группа, дата и версия снимка: wk|группа|ГГГГММДД|версия
+# (не длиннее 64 байт — ограничение Telegram на callback_data)
+WEEK_CALLBACK_PREFIX = 'wk|'
+CALLBACK_DATA_LIMIT = 64
+
+def week_pages(index):
+    """Страницы недели: даты по порядку, занятия без даты — последней страницей"""
+    pages = list(index['dates'])
+    if None in index['by_date']:
+        pages.append(None)
+    return pages
+
+def find_week_page(pages, day):
+    """Номер страницы дня day, а если его нет — ближайшего следующего (или последнего)"""
+    dated = pages[:-1] if pages and pages[-1] is None else pages
+    if day is None:
+        return len(pages) - 1
+    return min(bisect_left(dated, day), max(len(dated) - 1, 0))
+
+def encode_week_callback(group, day, version):
+    day_key = day.strftime('%Y%m%d') if day else '-'
+    data = f"{WEEK_CALLBACK_PREFIX}{group}|{day_key}|{version or 0}"
+    if len(data.encode('utf-8')) > CALLBACK_DATA_LIMIT:
+        # Слишком длинный номер группы — при нажатии берём группу пользователя
+        data = f"{WEEK_CALLBACK_PREFIX}|{day_key}|{version or 0}"
+    return data
+
+def decode_week_callback(data):
+    """(группа или '', дата или None, версия снимка) из callback_data кнопки"""
+    group, day_key, version = data[len(WEEK_CALLBACK_PREFIX):].rsplit('|', 2)
+    day = None if day_key == '-' else datetime.strptime(day_key, '%Y%m%d').date()
+    return group, day, int(version)
+
+def week_keyboard(group, pages, page, version):
+    """Кнопки на соседние дни; None, если день единственный"""
+    buttons = []
+    if page > 0:
+        day = pages[page - 1]
+        buttons.append(telebot.types.InlineKeyboardButton(
+            f"◀️ {format_site_date(day) if day else 'Без даты'}",
+            callback_data=encode_week_callback(group, day, version)
+        ))
+    if page + 1 < len(pages):
+        day = pages[page + 1]
+        buttons.append(telebot.types.InlineKeyboardButton(
+            f"{format_site_date(day) if day else 'Без даты'} ▶️",
+            callback_data=encode_week_callback(group, day, version)
+        ))
+    if not buttons:
+        return None
+    markup = telebot.types.InlineKeyboardMarkup()
+    markup.row(*buttons)
+    return markup
+
+def render_week_page(index, group, version, pages, page):
+    """Текст страницы недели (из кэша готовых ответов) и кнопки листания"""
+    day = pages[page]
+    
+    def render():
+        target_day = (day or datetime.now()).weekday()
+        blocks = format_schedule_with_day([(day, index['by_date'][day])], group, target_day, "НА БЛИЖАЙШИЕ ДНИ")
+        blocks[-1] += f"\n📄 День {page + 1} из {len(pages)}"
+        return tuple(blocks)
+    
+    blocks = get_rendered((group, 'day', day), version, render)
+    return "".join(blocks), week_keyboard(group, pages, page, version)
+
+# ---------- КЭШ ГОТОВЫХ ОТВЕТОВ ----------
+# Все в группе видят один и тот же текст, пока не поменялся снимок, поэтому
+# готовые ответы хранятся по ключу (группа, период, дата) для текущей версии
+# снимка. Новая версия снимка очищает кэш, старые записи вытесняются по LRU
+RENDER_CACHE_MAX_BYTES = 8 * 1024 * 1024  # Предел памяти под готовые тексты
+
+render_cache = OrderedDict()  # ключ -> текст, в порядке последнего использования
+render_cache_state = {'version': None, 'bytes': 0}
+render_cache_lock = Lock()
+
+def rendered_size(blocks):
+    return sum(len(block.encode('utf-8')) for block in blocks)
+
+def get_rendered(key, version, render):
+    """
+    Готовый ответ (кортеж блоков) из кэша или render(), если его там нет.
+    version — номер снимка; None (данные из базы) не кэшируется
+    """
+    if version is None:
+        return render()
+    
+    state = render_cache_state
+    with render_cache_lock:
+        if state['version'] != version:
+            render_cache.clear()
+            state['version'] = version
+            state['bytes'] = 0
+        blocks = render_cache.get(key)
+        if blocks is not None:
+            render_cache.move_to_end(key)
+            metrics.inc('btk_render_cache_total', result='hit')
+            return blocks
+    metrics.inc('btk_render_cache_total', result='miss')
     
-    text += "══════════════════════\n"
-    text += f"📊 <b>Всего пар:</b> {total_count}"
+    blocks = render()
+    size = rendered_size(blocks)
     
-    return text
+    with render_cache_lock:
+        # Пока рисовали, снимок мог обновиться — тогда ответ уже устарел
+        if state['version'] == version and key not in render_cache:
+            render_cache[key] = blocks
+            state['bytes'] += size
+            while state['bytes'] > RENDER_CACHE_MAX_BYTES and render_cache:
+                _, evicted = render_cache.popitem(last=False)
+                state['bytes'] -= rendered_size(evicted)
+    return blocks
+
+# ---------- ОЧЕРЕДИ ОБРАБОТЧИКОВ ----------
+# Быстрые ответы (старт, звонки, помощь, подписка, расписание из снимка)
+# и ответы, которым нужно дождаться обхода сайта, работают в разных пулах.
+# Медленные не могут занять все потоки и задержать /start для остальных,
+# а при переполнении очереди бот сразу отвечает «занят»
+FAST_LANE_WORKERS = 4
+SLOW_LANE_WORKERS = 8
+SLOW_LANE_MAX_PENDING = 40  # Сколько запросов расписания может ждать и выполняться сразу
+
+fast_lane = ThreadPoolExecutor(max_workers=FAST_LANE_WORKERS, thread_name_prefix='fast-lane')
+slow_lane = ThreadPoolExecutor(max_workers=SLOW_LANE_WORKERS, thread_name_prefix='slow-lane')
+slow_lane_slots = BoundedSemaphore(SLOW_LANE_MAX_PENDING)
+
+def run_safely(func, *args, queued_at=None):
+    """Ошибки из пула потоков иначе молча теряются"""
+    try:
+        func(*args)
+    except Exception as e:
+        print(f"❌ Ошибка в обработчике {func.__name__}: {e}")
+        traceback.print_exc()
+    finally:
+        if queued_at is not None:
+            metrics.observe('btk_handler_seconds', time.perf_counter() - queued_at, handler=func.__name__)
+
+def run_fast(func, *args):
+    fast_lane.submit(run_safely, func, *args, queued_at=time.perf_counter())
+
+def run_slow(chat_id, func, *args):
+    """Ставит задачу в медленную очередь или отвечает «занят», если она полна"""
+    if not slow_lane_slots.acquire(blocking=False):
+        print(f"🚦 Медленная очередь заполнена, отказ для {chat_id}")
+        metrics.inc('btk_slow_lane_rejected_total')
+        run_fast(bot.send_message, chat_id, "⏳ Сейчас очень много запросов, попробуй через минуту")
+        return
+    
+    queued_at = time.perf_counter()
+    
+    def job():
+        try:
+            run_safely(func, *args, queued_at=queued_at)
+        finally:
+            slow_lane_slots.release()
+    
+    slow_lane.submit(job)
+
+def run_schedule(message, func):
+    """
+    Кнопки расписания: пока снимок годен (или сайт лежит и ждать нечего),
+    ответ берётся из памяти — быстрый пул. Если идёт обход сайта, запрос
+    ждёт его конца без потока и без места в медленной очереди, а потом
+    отвечает из нового снимка. Место в очереди (с отказами) занимает только
+    запрос, который запускает новый обход
+    """
+    if not snapshot_read_waits(schedule_snapshot):
+        run_fast(func, message)
+        return
+    if when_done(SNAPSHOT_KEY, lambda: run_fast(func, message)):
+        return
+    # Обход запускается сразу, чтобы следующие нажатия к нему присоединились
+    trigger_background_refresh()
+    run_slow(message.chat.id, func, message)
+
+def in_fast_lane(handler):
+    """Декоратор: обработчик выполняется в быстром пуле"""
+    @wraps(handler)
+    def wrapper(update):
+        run_fast(handler, update)
+    return wrapper
 
 # ---------- Команды бота ----------
 def show_subscription_menu(message):
@@ -561,10 +1939,12 @@ def show_subscription_menu(message):
     )
 
 @bot.message_handler(commands=['start'])
+@in_fast_lane
 def start(message):
     markup = telebot.types.ReplyKeyboardMarkup(resize_keyboard=True)
-    markup.add('📅 Сегодня', '📆 Завтра', '📚 Неделя')
-    markup.add('🔔 Звонки', 'ℹ️ Помощь', '📢 Подписка')
+    markup.add('⏳ Сейчас', '📅 Сегодня', '📆 Завтра')
+    markup.add('📚 Неделя', '🔔 Звонки', '📢 Подписка')
+    markup.add('ℹ️ Помощь')
 
     welcome_text = (
         "👋 <b>Привет! Я бот расписания БТК</b>\n\n"
@@ -577,9 +1957,10 @@ def start(message):
         "1. Отправь номер группы (например, 301)\n"
         "2. Нажимай кнопки для просмотра\n\n"
         "🎯 <b>Кнопки:</b>\n"
+        "⏳ Сейчас - какая пара идёт и какая следующая\n"
         "📅 Сегодня - расписание на сегодня\n"
         "📆 Завтра - расписание на завтра\n"
-        "📚 Неделя - всё расписание\n"
+        "📚 Неделя - расписание по дням\n"
         "🔔 Звонки - расписание звонков\n"
         "📢 Подписка - уведомления об изменениях"
     )
@@ -592,6 +1973,7 @@ def start(message):
     )
 
 @bot.message_handler(commands=['subscribe'])
+@in_fast_lane
 def subscribe(message):
     """Подписка на уведомления"""
     user_id = message.chat.id
@@ -607,7 +1989,7 @@ def subscribe(message):
         
         subscribed_users.add(user_id)
     
-    save_subscriber(user_id)
+    db.save_subscriber(user_id)
     
     bot.send_message(
         user_id,
@@ -617,6 +1999,7 @@ def subscribe(message):
     )
 
 @bot.message_handler(commands=['unsubscribe'])
+@in_fast_lane
 def unsubscribe(message):
     """Отписка от уведомлений"""
     user_id = message.chat.id
@@ -632,7 +2015,7 @@ def unsubscribe(message):
         
         subscribed_users.remove(user_id)
     
-    remove_subscriber(user_id)
+    db.remove_subscriber(user_id)
     
     bot.send_message(
         user_id,
@@ -642,6 +2025,7 @@ def unsubscribe(message):
     )
 
 @bot.message_handler(commands=['stats'])
+@in_fast_lane
 def stats(message):
     """Статистика подписчиков (только для админа)"""
     if message.chat.id != YOUR_USER_ID:
@@ -651,15 +2035,56 @@ def stats(message):
     with subscribers_lock:
         count = len(subscribed_users)
     
+    with user_groups_lock:
+        users_count = len(user_groups)
+        top_groups = sorted(group_users.items(), key=lambda pair: len(pair[1]), reverse=True)[:5]
+        top_text = "\n".join(f"  • {escape(group)}: {len(users)}" for group, users in top_groups)
+    
     bot.send_message(
         message.chat.id,
         f"📊 <b>Статистика</b>\n\n"
         f"👥 Подписчиков: {count}\n"
+        f"🧑‍🎓 Пользователей с группой: {users_count}\n"
+        f"🏆 Самые большие группы:\n{top_text or '  —'}\n"
         f"🔔 Уведомления: {'ВКЛЮЧЕНЫ' if NOTIFICATIONS_ENABLED else 'ВЫКЛЮЧЕНЫ'}",
         parse_mode='HTML'
     )
 
+# Регистрируется раньше callback_handler: тот принимает все нажатия
+@bot.callback_query_handler(func=lambda call: call.data.startswith(WEEK_CALLBACK_PREFIX))
+@in_fast_lane
+def week_page_callback(call):
+    """Листание недели ◀️/▶️ — только из снимка в памяти, сайт не обходится"""
+    use_minsk_time()
+    
+    group, day, version = decode_week_callback(call.data)
+    group = group or get_user_group(call.message.chat.id)
+    if not group:
+        bot.answer_callback_query(call.id, "❌ Сначала отправь номер группы")
+        return
+    
+    index, updated_at, current_version = peek_group_schedule(group)
+    pages = week_pages(index)
+    if not pages:
+        bot.answer_callback_query(call.id, "😕 Расписание не найдено")
+        return
+    
+    # Снимок мог обновиться после отправки кнопки — показываем новые данные
+    text, markup = render_week_page(index, group, current_version, pages, find_week_page(pages, day))
+    bot.answer_callback_query(call.id, "🔄 Расписание обновилось" if version != (current_version or 0) else None)
+    try:
+        bot.edit_message_text(
+            text + format_data_age(updated_at),
+            call.message.chat.id,
+            call.message.message_id,
+            parse_mode='HTML',
+            reply_markup=markup
+        )
+    except Exception as e:
+        print(f"Ошибка при листании недели: {e}")
+
 @bot.callback_query_handler(func=lambda call: True)
+@in_fast_lane
 def callback_handler(call):
     """Обработчик нажатий на инлайн-кнопки"""
     user_id = call.message.chat.id
@@ -671,7 +2096,7 @@ def callback_handler(call):
                 return
             subscribed_users.add(user_id)
         
-        save_subscriber(user_id)
+        db.save_subscriber(user_id)
         bot.answer_callback_query(call.id, "✅ Ты подписан!")
         
     elif call.data == 'unsubscribe':
@@ -681,7 +2106,7 @@ def callback_handler(call):
                 return
             subscribed_users.remove(user_id)
         
-        remove_subscriber(user_id)
+        db.remove_subscriber(user_id)
         bot.answer_callback_query(call.id, "❌ Ты отписался")
         
     elif call.data == 'status':
@@ -711,35 +2136,36 @@ def handle_message(message):
     text = message.text
 
     if text == '📅 Сегодня':
-        show_schedule(message, 'today')
+        run_schedule(message, show_today)
     elif text == '📆 Завтра':
-        show_schedule(message, 'tomorrow')
+        run_schedule(message, show_tomorrow)
     elif text == '📚 Неделя':
-        show_schedule(message, 'week')
+        run_schedule(message, show_week)
+    elif text == '⏳ Сейчас':
+        run_fast(show_now, message)
     elif text == '🔔 Звонки':
-        show_bell_schedule(message)
+        run_fast(show_bell_schedule, message)
     elif text == 'ℹ️ Помощь':
-        show_help(message)
+        run_fast(show_help, message)
     elif text == '📢 Подписка':
-        show_subscription_menu(message)
+        run_fast(show_subscription_menu, message)
     else:
-        # Сохраняем группу
-        try:
-            conn = sqlite3.connect('schedule.db')
-            c = conn.cursor()
-            c.execute("INSERT OR REPLACE INTO users (user_id, group_name) VALUES (?, ?)",
-                      (message.chat.id, text))
-            conn.commit()
-            conn.close()
+        run_fast(save_group, message)
 
-            bot.send_message(
-                message.chat.id,
-                f"✅ <b>Группа {text} сохранена!</b>\n\nТеперь нажимай кнопки для просмотра расписания",
-                parse_mode='HTML'
-            )
-        except Exception as e:
-            bot.send_message(message.chat.id, "❌ Ошибка при сохранении группы")
-            print(f"Ошибка БД: {e}")
+def save_group(message):
+    """Сохраняет номер группы, присланный текстом"""
+    text = message.text
+    try:
+        set_user_group(message.chat.id, text)
+
+        bot.send_message(
+            message.chat.id,
+            f"✅ <b>Группа {escape(text)} сохранена!</b>\n\nТеперь нажимай кнопки для просмотра расписания",
+            parse_mode='HTML'
+        )
+    except Exception as e:
+        bot.send_message(message.chat.id, "❌ Ошибка при сохранении группы")
+        print(f"Ошибка БД: {e}")
 
 def show_bell_schedule(message):
     """Показывает расписание звонков"""
@@ -760,14 +2186,28 @@ def show_bell_schedule(message):
 
     bot.send_message(message.chat.id, full_text, parse_mode='HTML')
 
+def show_now(message):
+    """Текущая и следующая пара из снимка, без обращения к сайту"""
+    use_minsk_time()
+    
+    group = get_user_group(message.chat.id)
+    if not group:
+        bot.send_message(message.chat.id, "❌ Сначала отправь номер группы")
+        return
+    
+    index, updated_at, _ = peek_group_schedule(group)
+    text = render_now(index, group, datetime.now()) + format_data_age(updated_at)
+    bot.send_message(message.chat.id, text, parse_mode='HTML')
+
 def show_help(message):
     help_text = (
         "ℹ️ <b>ПОМОЩЬ ПО БОТУ</b>\n\n"
         "📌 <b>Основные команды:</b>\n"
         "• <b>Отправь номер группы</b> - сохранить группу\n"
+        "• <b>⏳ Сейчас</b> - текущая и следующая пара\n"
         "• <b>📅 Сегодня</b> - расписание на сегодня\n"
         "• <b>📆 Завтра</b> - расписание на завтра\n"
-        "• <b>📚 Неделя</b> - всё расписание\n"
+        "• <b>📚 Неделя</b> - расписание по дням, листай ◀️/▶️\n"
         "• <b>🔔 Звонки</b> - расписание звонков\n"
         "• <b>📢 Подписка</b> - уведомления об изменениях\n"
         "• <b>/subscribe</b> - подписаться\n"
@@ -780,134 +2220,60 @@ def show_help(message):
     )
     bot.send_message(message.chat.id, help_text, parse_mode='HTML')
 
-def show_schedule(message, period):
+# Отдельная функция на кнопку — своя строка в btk_handler_seconds
+def show_today(message):
+    show_schedule(message, 'today')
+
+def show_tomorrow(message):
+    show_schedule(message, 'tomorrow')
+
+def show_week(message):
+    show_schedule(message, 'week')
+
+def use_minsk_time():
     # Устанавливаем часовой пояс для корректной даты
     os.environ['TZ'] = 'Europe/Minsk'
     try:
         time.tzset()
     except:
         pass
+
+def show_schedule(message, period):
+    use_minsk_time()
     
     # Получаем группу пользователя
-    try:
-        conn = sqlite3.connect('schedule.db')
-        c = conn.cursor()
-        c.execute("SELECT group_name FROM users WHERE user_id = ?", (message.chat.id,))
-        result = c.fetchone()
-        conn.close()
-    except Exception as e:
-        bot.send_message(message.chat.id, "❌ Ошибка при получении данных")
-        print(f"Ошибка БД: {e}")
-        return
+    group = get_user_group(message.chat.id)
 
-    if not result:
+    if not group:
         bot.send_message(message.chat.id, "❌ Сначала отправь номер группы")
         return
 
-    group = result[0]
-
-    msg = bot.send_message(message.chat.id, f"🔍 <b>Ищу расписание для группы {group}...</b>", parse_mode='HTML')
+    msg = bot.send_message(message.chat.id, f"🔍 <b>Ищу расписание для группы {escape(group)}...</b>", parse_mode='HTML')
 
-    schedule = get_schedule_from_site(group)
+    index, updated_at, version = get_group_schedule(group)
 
-    if schedule:
-        print(f"\n{'='*50}")
-        print(f"📊 ВСЕГО НАЙДЕНО: {len(schedule)} занятий для группы {group}")
-        
-        # Показываем все уникальные даты в расписании
-        all_dates = sorted(set([item['date'] for item in schedule]))
-        print(f"📅 Даты в расписании: {all_dates}")
-        
-        # Определяем сегодняшнюю дату
+    if index['by_date'] and period == 'week':
+        # Неделя по одному дню, начиная с сегодняшнего или ближайшего
+        pages = week_pages(index)
+        page = find_week_page(pages, datetime.now().date())
+        text, markup = render_week_page(index, group, version, pages, page)
+        bot.edit_message_text(
+            text + format_data_age(updated_at),
+            message.chat.id,
+            msg.message_id,
+            parse_mode='HTML',
+            reply_markup=markup
+        )
+    elif index['by_date']:
         now = datetime.now()
-        
-        # Словарь русских месяцев
-        months_ru = {
-            1: 'янв', 2: 'фев', 3: 'мар', 4: 'апр', 5: 'май', 6: 'июн',
-            7: 'июл', 8: 'авг', 9: 'сен', 10: 'окт', 11: 'ноя', 12: 'дек'
-        }
-        
-        today_str = f"{now.day}-{months_ru[now.month]}"
-        tomorrow_str = f"{(now + timedelta(days=1)).day}-{months_ru[(now + timedelta(days=1)).month]}"
-        
-        print(f"📅 Сегодня (вычислено): {today_str}")
-        print(f"📅 Завтра (вычислено): {tomorrow_str}")
-        
-        # Определяем день недели
-        today = now.weekday()
-        
-        if period == 'today':
-            target_day = today
-            period_name = "СЕГОДНЯ"
-            target_date = today_str
-            
-            print(f"🔍 Ищем дату: {target_date}")
-            
-            # Фильтруем только сегодняшние занятия
-            filtered_schedule = []
-            for item in schedule:
-                if item['date'].lower() == target_date.lower():
-                    filtered_schedule.append(item)
-            
-            print(f"✅ Найдено сегодня: {len(filtered_schedule)}")
-            
-            if not filtered_schedule:
-                # Показываем доступные даты
-                dates_list = "\n".join(all_dates[:10])
-                bot.edit_message_text(
-                    f"😕 <b>Нет расписания на сегодня</b>\n\n"
-                    f"Для группы {group} не найдено занятий на {target_date}.\n\n"
-                    f"📅 <b>Доступные даты:</b>\n{dates_list}\n\n"
-                    f"Попробуй посмотреть всё расписание (📚 Неделя)",
-                    message.chat.id,
-                    msg.message_id,
-                    parse_mode='HTML'
-                )
-                return
-            
-            text = format_schedule_with_day(filtered_schedule, group, target_day, period_name)
-            
-        elif period == 'tomorrow':
-            target_day = (today + 1) % 7
-            period_name = "ЗАВТРА"
-            target_date = tomorrow_str
-            
-            print(f"🔍 Ищем дату: {target_date}")
-            
-            # Фильтруем только завтрашние занятия
-            filtered_schedule = []
-            for item in schedule:
-                if item['date'].lower() == target_date.lower():
-                    filtered_schedule.append(item)
-            
-            print(f"✅ Найдено завтра: {len(filtered_schedule)}")
-            
-            if not filtered_schedule:
-                bot.edit_message_text(
-                    f"😕 <b>Нет расписания на завтра</b>\n\n"
-                    f"Для группы {group} не найдено занятий на {target_date}.\n\n"
-                    f"Попробуй посмотреть всё расписание (📚 Неделя)",
-                    message.chat.id,
-                    msg.message_id,
-                    parse_mode='HTML'
-                )
-                return
-            
-            text = format_schedule_with_day(filtered_schedule, group, target_day, period_name)
-            
-        else:  # week
-            # Для недели показываем всё расписание
-            text = format_schedule_with_day(schedule, group, today, "НА БЛИЖАЙШИЕ ДНИ")
-        
-        try:
-            bot.edit_message_text(text, message.chat.id, msg.message_id, parse_mode='HTML')
-        except Exception as e:
-            print(f"Ошибка при редактировании: {e}")
-            if len(text) > 4096:
-                for i in range(0, len(text), 4096):
-                    bot.send_message(message.chat.id, text[i:i+4096], parse_mode='HTML')
-            else:
-                bot.send_message(message.chat.id, text, parse_mode='HTML')
+        blocks = get_rendered(
+            (group, period, now.date()),
+            version,
+            lambda: render_schedule(index, group, period, now)
+        )
+        # Пометка о давности данных — в конце последнего сообщения
+        blocks = blocks[:-1] + (blocks[-1] + format_data_age(updated_at),)
+        send_chunks(message.chat.id, msg.message_id, pack_messages(blocks))
     else:
         bot.edit_message_text(
             "😕 <b>Не удалось найти расписание.</b>\n\n"
@@ -924,9 +2290,6 @@ if __name__ == "__main__":
     print("🚀 ЗАПУСК БОТА РАСПИСАНИЯ БТК")
     print("="*50)
 
-    # Запускаем Flask в отдельном потоке
-    keep_alive()
-
     # Запускаем планировщик проверки расписания
     scheduler = start_scheduler()
 
@@ -936,10 +2299,22 @@ if __name__ == "__main__":
 
     # Запускаем бота
     try:
-        bot.polling(non_stop=True, interval=0)
+        if WEBHOOK_URL:
+            # Обновления приходят на Flask-сервер, он работает в главном потоке
+            setup_webhook()
+            print("🌐 Flask-сервер (вебхук) запущен на порту 8080")
+            run()
+        else:
+            # Запускаем Flask в отдельном потоке
+            keep_alive()
+            # Вебхук, оставшийся с прошлого запуска, мешает long polling
+            bot.remove_webhook()
+            bot.polling(non_stop=True, interval=0)
     except Exception as e:
         print(f"❌ Ошибка при запуске бота: {e}")
     finally:
         # Останавливаем планировщик при завершении бота
         if 'scheduler' in locals():
             scheduler.shutdown()
+        # Дописываем в базу всё, что осталось в очереди
+        db.flush()
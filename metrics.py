@@ -0,0 +1,152 @@
+"""
+Метрики бота в текстовом формате Prometheus (адрес /metrics).
+
+Счётчики и гистограммы пишутся без блокировок: у каждого потока свой
+шард — обычный dict, в который пишет только он. /metrics складывает шарды
+при чтении, а шарды завершившихся потоков сливаются в общий, чтобы
+одноразовые потоки (рассылка, single-flight) не копили память.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Секунды: от быстрых ответов из памяти до обхода всего сайта
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_metrics = {}     # имя -> {'type', 'help', 'buckets'}
+_gauges = {}      # имя -> функция, которая возвращает значение при чтении
+_shards = []      # [(поток, шард)]
+_shards_lock = threading.Lock()  # Только регистрация потоков и чтение /metrics
+_retired = {}     # Сумма шардов завершившихся потоков
+_local = threading.local()
+
+# ---------- Описание метрик ----------
+def counter(name, help_text):
+    _metrics[name] = {'type': 'counter', 'help': help_text, 'buckets': None}
+
+def histogram(name, help_text, buckets=DEFAULT_BUCKETS):
+    _metrics[name] = {'type': 'histogram', 'help': help_text, 'buckets': tuple(buckets)}
+
+def gauge(name, help_text, func):
+    """Значение считается при каждом чтении /metrics вызовом func()"""
+    _metrics[name] = {'type': 'gauge', 'help': help_text, 'buckets': None}
+    _gauges[name] = func
+
+# ---------- Запись ----------
+def _shard():
+    shard = getattr(_local, 'shard', None)
+    if shard is None:
+        shard = {}
+        with _shards_lock:
+            _shards.append((threading.current_thread(), shard))
+        _local.shard = shard
+    return shard
+
+def inc(name, value=1, **labels):
+    """Увеличивает счётчик"""
+    key = (name, tuple(sorted(labels.items())))
+    shard = _shard()
+    shard[key] = shard.get(key, 0) + value
+
+def observe(name, value, **labels):
+    """Добавляет значение в гистограмму"""
+    key = (name, tuple(sorted(labels.items())))
+    shard = _shard()
+    buckets = _metrics[name]['buckets']
+    counts = shard.get(key)
+    if counts is None:
+        # Число попаданий в каждую корзину (последняя — +Inf), затем сумма
+        counts = shard[key] = [0] * (len(buckets) + 1) + [0.0]
+    counts[bisect_left(buckets, value)] += 1
+    counts[-1] += value
+
+@contextmanager
+def timer(name, **labels):
+    """Записывает длительность блока with в гистограмму"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+# ---------- Чтение ----------
+def _add(total, key, value):
+    if isinstance(value, list):
+        current = total.get(key)
+        if current is None:
+            total[key] = list(value)
+        else:
+            for i, part in enumerate(value):
+                current[i] += part
+    else:
+        total[key] = total.get(key, 0) + value
+
+def _collect():
+    """Сумма всех шардов; шарды завершившихся потоков сливаются в _retired"""
+    with _shards_lock:
+        alive = []
+        for thread, shard in _shards:
+            if thread.is_alive():
+                alive.append((thread, shard))
+            else:
+                for key, value in shard.items():
+                    _add(_retired, key, value)
+        _shards[:] = alive
+
+        total = {}
+        for key, value in _retired.items():
+            _add(total, key, value)
+        for _, shard in alive:
+            # list() копирует словарь за один шаг, пока поток может в него писать
+            for key, value in list(shard.items()):
+                _add(total, key, list(value) if isinstance(value, list) else value)
+    return total
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in pairs) + '}'
+
+def _format_number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+def render():
+    """Все метрики в текстовом формате Prometheus"""
+    total = _collect()
+    by_name = {}
+    for (name, labels), value in total.items():
+        by_name.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name, meta in _metrics.items():
+        lines.append(f"# HELP {name} {meta['help']}")
+        lines.append(f"# TYPE {name} {meta['type']}")
+
+        if meta['type'] == 'gauge':
+            try:
+                value = _gauges[name]()
+            except Exception:
+                continue
+            lines.append(f"{name} {_format_number(value)}")
+            continue
+
+        for labels, value in sorted(by_name.get(name, []), key=lambda pair: pair[0]):
+            if meta['type'] == 'counter':
+                lines.append(f"{name}{_format_labels(labels)} {_format_number(value)}")
+                continue
+
+            cumulative = 0
+            for bound, count in zip(meta['buckets'] + ('+Inf',), value[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_number(value[-1])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+
+    return "\n".join(lines) + "\n"